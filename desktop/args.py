@@ -17,6 +17,7 @@ class Args:
         self.parser.add_argument("--demo", action="store_true", help="Force demo visualization method. This visualization method is preferred when --camera is used.")
         self.parser.add_argument("--debug", action="store_true", help="Force debug visualization method. This visualization method is preferred when --input is used.")
         self.parser.add_argument("--removal", action="store_true", help="Force removal visualization method. This visualization method has the highest priority.")
+        self.parser.add_argument("--removal-median", action="store_true", help="Fill in removed objects from a running temporal median of the input instead of an older frame. Used with --removal.")
         self.parser.add_argument("--no-record", action="store_true", help="Switch off record all frames.")
         self.parser.add_argument("--include", type=str, help="<path> File with additional command-line arguments. The format is the same as when specifying parameters on the command line. Whitespace such as tabs and endlines is allowed.")
         self.parser.add_argument("--input", type=str, nargs='+', help="<path> Path to an input video file. Can be used multiple times. Must not be used with --camera.")
@@ -28,10 +29,28 @@ class Args:
         self.parser.add_argument("--camera", type=int, help="<int> Input camera device ID. When this option is used, stream from the specified camera will be used as input. Using ID 0 selects the default camera, if available. Must not be used with --input, --wait, --fast, --frame, --pause.")
         self.parser.add_argument("--yuv", action="store_true", help="Feed image data into the algorithm in YCbCr color space.")
         self.parser.add_argument("--record-dir", type=str, help="<dir> Output directory to save video to. A new video file will be created, storing the input video with optionally overlaid detections. The name of the video file will be determined by system time. The directory must exist.")
+        self.parser.add_argument("--record-process", action="store_true", help="Encode recorded video in a separate process. Frames are passed to the encoder through shared memory, so that encoding does not compete with detection for the interpreter. Frames are dropped when the encoder falls behind.")
+        self.parser.add_argument("--preroll", type=float, help="<sec> Length of the pre-roll kept before each event in automatic recording mode. Frames are held compressed in memory and decoded only when an event triggers recording. When not specified, the last 60 raw frames are kept.")
+        self.parser.add_argument("--preroll-budget", type=float, default=512, help="<MB> Memory budget of the compressed pre-roll buffer. The oldest frames are discarded when the budget is exceeded. Used with --preroll.")
+        self.parser.add_argument("--preroll-format", type=str, default="jpg", choices=["jpg", "png"], help="<jpg|png> Encoding of the frames in the pre-roll buffer. Used with --preroll.")
         self.parser.add_argument("--eval-dir", type=str, help="<dir> Directory to save evaluation report to. A single file text file will be created there with a unique name based on timestamp. Must be used with --gt.")
         self.parser.add_argument("--tex", action="store_true", help="Format tables in the evaluation report so that they can be used in the TeX typesetting system. Must be used with --eval-dir.")
         self.parser.add_argument("--detect-dir", type=str, help="<dir> Directory to save detection output to. A single XML file will be created there with a unique name based on timestamp.")
         self.parser.add_argument("--score-file", type=str, help="<file> File to write a numeric evaluation score to.")
+        self.parser.add_argument("--stage-times", type=str, help="<file> File to append per-sequence stage timings to, one JSON object per line. Each object lists sample count, total time and q50/q95/q99 quantiles in milliseconds for the decode, convert, algorithm, evaluate, report and visualize stages.")
+        self.parser.add_argument("--trace-file", type=str, help="<file> File to write a Chrome trace-event JSON to. Every stage of every frame is recorded, as well as work done by the recorder threads, so that the run can be inspected in a trace viewer such as chrome://tracing or Perfetto.")
+        self.parser.add_argument("--eval-cache", type=str, help="<dir> Directory with cached evaluation results. A sequence is processed only if its video, ground truth, algorithm parameters or the algorithm itself changed since it was last evaluated; otherwise its results are loaded from the cache. The cache is used only with --headless and without --detect-dir, --frame or any of --pause-*. Must be used with --gt or --gt-dir.")
+        self.parser.add_argument("--checkpoint", type=str, help="<file> File to append the results of each completed sequence to. An interrupted run can be continued with --resume. Must be used with --gt or --gt-dir.")
+        self.parser.add_argument("--resume", action="store_true", help="Continue the run recorded in --checkpoint. Sequences found in the checkpoint are not processed again, their results are restored instead, so the final report is the same as that of an uninterrupted run. Must be used with --checkpoint.")
+        self.parser.add_argument("--manifest", type=str, help="<file> Dataset manifest built by manifest.py. Dimensions of the ground truth are checked against the videos before any processing starts, and --shard balances shards using the recorded frame counts instead of reading each file.")
+        self.parser.add_argument("--shard", type=str, help="<i>/<n> Process only the i-th of n shards of the input sequences, 1 <= i <= n. Sequences are split deterministically so that the shards have similar total frame counts. Save the results of each shard with --eval-dir and combine them with shard.py. Must not be used with --camera.")
+        self.parser.add_argument("--sweep", type=str, help="<file> JSON file with a parameter sweep specification. Instead of a single run, every configuration of the sweep is evaluated and a table of configurations ranked by F-score is printed. Each sequence is decoded only once and its frames are shared by all configurations. Must be used with --gt or --gt-dir.")
+        self.parser.add_argument("--sweep-workers", type=int, default=os.cpu_count(), help="<int> Number of worker threads running the configurations of a sweep. Used with --sweep.")
+        self.parser.add_argument("--sweep-race", type=int, help="<int> Run the sweep as a successive-halving race with the given reduction factor. All configurations are evaluated on the first few sequences, only the best 1/<int> of them by F-score advance, and each round multiplies the number of sequences by <int>. Used with --sweep.")
+        self.parser.add_argument("--sweep-race-start", type=int, default=1, help="<int> Number of sequences in the first round of a race. Used with --sweep-race.")
+        self.parser.add_argument("--preview-port", type=int, help="<port> Serve a live MJPEG preview at http://127.0.0.1:<port>/. With --headless it shows the input frames with the detected points, otherwise it shows the window contents. Frames are encoded on a separate thread and only while a client is connected.")
+        self.parser.add_argument("--preview-fps", type=float, default=5, help="<fps> Maximum frame rate of the preview. Used with --preview-port.")
+        self.parser.add_argument("--preview-quality", type=int, default=70, help="<int> JPEG quality of the preview, between 0 and 100. Used with --preview-port.")
         self.parser.add_argument("--pause-fp", action="store_true", help="Playback will pause whenever a detection is deemed a false positive. Must be used with --gt.")
         self.parser.add_argument("--pause-fn", action="store_true", help="Playback will pause whenever a detection is deemed a false negative. Must be used with --gt.")
         self.parser.add_argument("--pause-rg", action="store_true", help="Playback will pause whenever a regression is detected, i.e. whenever a frame is evaluated as false and baseline is true. Must be used with --baseline.")
@@ -42,6 +61,7 @@ class Args:
         self.parser.add_argument("--wait", type=int, help="<ms> Specifies the frame time in milliseconds, allowing for slow playback. Must not be used with --camera, --headless.")
         self.parser.add_argument("--exposure", type=float, help="Set exposure value. Should be between 0 and 1. Usually between 0.03 and 0.1.")
         self.parser.add_argument("--fps", type=float, help="Set number of frames per second.")
+        self.parser.add_argument("--display-fps", type=float, help="<fps> Show at most this many frames per second. Every frame is still processed and the visualization still keeps track of every detection (trajectories, speeds, leaderboard) and records every frame, only drawing and showing the frames in between is skipped. Frames are shown one by one while paused.")
         self.parser.add_argument("--radius", type=float, help="Set object radius in cm. Used for speed estimation. Used if --p2cm is not specified. By default used for tennis/floorball: 3.6 cm.")
         self.parser.add_argument("--p2cm", type=float, help="Set how many cm are in one pixel on object. Used for speed estimation. More dominant than --radius.")
         self.parser.add_argument("--dfactor", type=float, help="Differential image threshold factor. Default 1.0.")
@@ -86,6 +106,19 @@ class Args:
         self.parser.add_argument("--p-max-gaps-length", type=float, help="<float>")
         self.parser.add_argument("--p-min-motion", type=float, help="<float>")
 
+    ALGORITHM_OPTIONS = ["algorithm", "dfactor", "yuv"]
+
+    def parameters(self):
+        values = []
+        for name, value in sorted(vars(self.args).items()):
+            if name not in self.ALGORITHM_OPTIONS and not name.startswith("p_"):
+                continue
+            if value is None or value is False:
+                continue
+            option = "--" + name.replace("_", "-")
+            values.append(option if value is True else f"{option} {value}")
+        return " ".join(values)
+
     def validate(self):
         if not self.args.input and self.args.camera is None and not self.args.input_dir:
             raise ValueError("one of --input, --input-dir, --camera must be specified")
@@ -117,6 +150,30 @@ class Args:
             raise ValueError("One visualization method should be used.")
         if self.args.headless and self.args.wait is not None:
             raise ValueError("--headless cannot be used with --wait or --fast")
+        if self.args.checkpoint and not self.args.gt and not self.args.gt_dir:
+            raise ValueError("--checkpoint must be used with --gt")
+        if self.args.resume and not self.args.checkpoint:
+            raise ValueError("--resume must be used with --checkpoint")
+        if self.args.eval_cache and not self.args.gt and not self.args.gt_dir:
+            raise ValueError("--eval-cache must be used with --gt")
+        if self.args.sweep and not self.args.gt and not self.args.gt_dir:
+            raise ValueError("--sweep must be used with --gt")
+        if self.args.sweep_race is not None:
+            if not self.args.sweep:
+                raise ValueError("--sweep-race must be used with --sweep")
+            if self.args.sweep_race < 2:
+                raise ValueError("--sweep-race must be at least 2")
+        if self.args.shard and self.args.camera is not None:
+            raise ValueError("--shard cannot be used with --camera")
+        if self.args.sweep and self.args.camera is not None:
+            raise ValueError("--sweep cannot be used with --camera")
+        if self.args.display_fps is not None and self.args.display_fps <= 0:
+            raise ValueError("--display-fps must be positive")
+        if self.args.preview_port is not None:
+            if self.args.preview_fps <= 0:
+                raise ValueError("--preview-fps must be positive")
+            if not 0 <= self.args.preview_quality <= 100:
+                raise ValueError("--preview-quality must be between 0 and 100")
         if not self.args.eval_dir and self.args.tex:
             raise ValueError("--tex cannot be used without --eval-dir")
 
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import hashlib
+from evaluator import Event, event_name
+
+CHUNK_SIZE = 1 << 20
+
+def file_stamp(path):
+    info = os.stat(path)
+    return [info.st_size, info.st_mtime_ns]
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def encode_file_results(file_results, summary):
+    return {
+        "name": file_results.name,
+        "frames": {event_name(event): [frame.get(event, 0) for frame in file_results.frames] for event in [Event.FN, Event.FP, Event.TN, Event.TP]},
+        "iou": file_results.iou,
+        "summary": summary,
+    }
+
+def decode_file_results(entry, results):
+    """Add the sequence stored in entry to results and return its detection summary."""
+    file_results = results.new_file(entry["name"])
+    events = [Event.FN, Event.FP, Event.TN, Event.TP]
+    columns = [entry["frames"][event_name(event)] for event in events]
+    file_results.frames = [dict(zip(events, values)) for values in zip(*columns)]
+    file_results.iou = entry["iou"]
+    return entry["summary"]
+
+class EvaluationCache:
+    """Stores the evaluation of each sequence under a key derived from everything that affects it.
+
+    The key covers the contents of the video and ground truth files, the algorithm parameters and
+    the code of the algorithm and evaluator modules, so an entry is reused only when processing the
+    sequence again would produce the same results.
+    """
+    VERSION = "1"
+    CODE_MODULES = ["algorithm", "evaluator"]
+    INDEX_FILE = "files.json"
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, self.INDEX_FILE)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+
+    def file_hash(self, path):
+        # hashing a long video takes a while, so the digest is remembered until the file changes
+        path = os.path.abspath(path)
+        stamp = file_stamp(path)
+        entry = self.index.get(path)
+        if entry and entry["stamp"] == stamp:
+            return entry["hash"]
+        self.index[path] = {"stamp": stamp, "hash": hash_file(path)}
+        self.write_json(self.index_path, self.index)
+        return self.index[path]["hash"]
+
+    def key(self, video, gt, args):
+        digest = hashlib.sha256()
+        digest.update(self.VERSION.encode())
+        digest.update(self.file_hash(video).encode())
+        digest.update(self.file_hash(gt).encode())
+        digest.update(args.parameters().encode())
+        for name in self.CODE_MODULES:
+            module = sys.modules.get(name)
+            if module is not None and getattr(module, "__file__", None):
+                digest.update(self.file_hash(module.__file__).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key, results):
+        """Restore a cached sequence into results. Returns the detection summary, or None on a miss."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return decode_file_results(json.load(f), results)
+
+    def store(self, key, file_results, summary):
+        self.write_json(self.path(key), encode_file_results(file_results, summary))
+
+    def write_json(self, path, value):
+        # write to a temporary file first, so that an interrupted run never leaves a broken entry
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as f:
+            json.dump(value, f)
+        os.replace(temp, path)
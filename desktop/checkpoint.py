@@ -0,0 +1,57 @@
+import os
+import json
+from cache import encode_file_results, decode_file_results
+
+class Checkpoint:
+    """Append-only record of the sequences completed by a run, one JSON line per sequence.
+
+    The first line holds the algorithm parameters, so that a run is never resumed with results
+    produced by a different configuration. Every line is flushed to disk before the next sequence
+    starts, and a line cut short by a crash is dropped when the checkpoint is read back.
+    """
+    def __init__(self, file, parameters, resume):
+        self.file = file
+        self.done = {}
+        if resume and os.path.exists(file):
+            self.read(parameters)
+        else:
+            with open(file, "w") as f:
+                f.write(json.dumps({"parameters": parameters}) + "\n")
+
+    def read(self, parameters):
+        valid = 0
+        with open(self.file, "rb") as f:
+            for num, line in enumerate(f):
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if num == 0:
+                    if entry.get("parameters") != parameters:
+                        raise ValueError(f"checkpoint '{self.file}' was written with different parameters")
+                else:
+                    self.done[entry["input"]] = entry
+                valid += len(line)
+        if valid == 0:
+            raise ValueError(f"checkpoint '{self.file}' is damaged")
+        # appending after a partial line would corrupt the next entry as well
+        with open(self.file, "r+b") as f:
+            f.truncate(valid)
+        print(f"Resuming with {len(self.done)} completed sequences")
+
+    def load(self, input, results):
+        entry = self.done.get(input)
+        if entry is None:
+            return None
+        return decode_file_results(entry, results)
+
+    def store(self, input, file_results, summary):
+        entry = encode_file_results(file_results, summary)
+        entry["input"] = input
+        with open(self.file, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done[input] = entry
@@ -1,6 +1,7 @@
 import os
 import numpy as np
 import cv2
+from snapshot import pack_points
 
 class Event:
     TP = 0
@@ -98,51 +99,57 @@ class Results:
         else:
             return FileResults("(no results)")
 
+    INTRO_TOKEN = "/FMO/EVALUATION/V3/"
+    EVENT_ORDER = [Event.FN, Event.FP, Event.TN, Event.TP]
+
     def load(self, file):
+        self.list = []
+        self.map = {}
         with open(file, "r") as f:
-            lines = f.readlines()
-        intro_token = "/FMO/EVALUATION/V3/"
-        if intro_token not in lines[0]:
+            self.read(f)
+
+    def read(self, f):
+        """Add the results stored in an open file. The file is consumed one line at a time, and
+        anything before the start token (such as the text of an evaluation report) is skipped."""
+        tokens = (token for line in f for token in line.split())
+        if not any(token == self.INTRO_TOKEN for token in tokens):
             raise ValueError("failed to find data start token")
-        num_files = int(lines[1])
-        index = 2
-        for _ in range(num_files):
-            name = lines[index].strip()
-            file_results = self.new_file(name)
-            num_frames = int(lines[index + 1])
-            num_ious = int(lines[index + 2])
-            file_results.frames = [{} for _ in range(num_frames)]
-            index += 3
-            for event in [Event.FN, Event.FP, Event.TN, Event.TP]:
-                event_name_str = event_name(event)
-                if event_name_str not in lines[index]:
-                    raise ValueError(f"expected {event_name_str} but got {lines[index]}")
-                index += 1
-                for frame in file_results.frames:
-                    frame[event] = int(lines[index])
-                    index += 1
-            if num_ious > 0:
-                file_results.iou = [int(lines[index + i]) for i in range(num_ious)]
-                index += num_ious
-            if index >= len(lines):
-                raise ValueError("error while parsing")
-
-    def save(self, file):
-        with open(file, "w") as f:
-            f.write("/FMO/EVALUATION/V3/\n")
-            f.write(f"{len(self.map)}\n")
-            for name, file_results in self.map.items():
-                f.write(f"{name} {len(file_results.frames)} {len(file_results.iou)}\n")
-                for event in [Event.FN, Event.FP, Event.TN, Event.TP]:
-                    f.write(event_name(event))
+        try:
+            num_files = int(next(tokens))
+            for _ in range(num_files):
+                file_results = self.new_file(next(tokens))
+                num_frames = int(next(tokens))
+                num_ious = int(next(tokens))
+                file_results.frames = [{} for _ in range(num_frames)]
+                for event in self.EVENT_ORDER:
+                    token = next(tokens)
+                    if token != event_name(event):
+                        raise ValueError(f"expected {event_name(event)} but got {token}")
                     for frame in file_results.frames:
-                        f.write(f" {frame[event]}")
-                    f.write("\n")
-                if len(file_results.iou) > 0:
-                    f.write("IOU")
-                    for value in file_results.iou:
-                        f.write(f" {value}")
-                    f.write("\n")
+                        frame[event] = int(next(tokens))
+                if num_ious > 0:
+                    token = next(tokens)
+                    if token != "IOU":
+                        raise ValueError(f"expected 'IOU' but got '{token}'")
+                    file_results.iou = [int(next(tokens)) for _ in range(num_ious)]
+        except StopIteration:
+            raise ValueError("error while parsing")
+
+    def save(self, out):
+        out.write(f"{self.INTRO_TOKEN}\n")
+        out.write(f"{len(self.map)}\n")
+        for name, file_results in self.map.items():
+            out.write(f"{name} {len(file_results.frames)} {len(file_results.iou)}\n")
+            for event in self.EVENT_ORDER:
+                out.write(event_name(event))
+                for frame in file_results.frames:
+                    out.write(f" {frame[event]}")
+                out.write("\n")
+            if len(file_results.iou) > 0:
+                out.write("IOU")
+                for value in file_results.iou:
+                    out.write(f" {value}")
+                out.write("\n")
 
     def make_iou_histogram(self, bins):
         divisor = int(round(FileResults.IOU_STORAGE_FACTOR / bins))
@@ -167,9 +174,11 @@ class Results:
 class Evaluator:
     FRAME_OFFSET = -1
 
-    def __init__(self, gt_filename, dims, results, baseline):
-        self.gt = ObjectSet()
-        self.gt.load_ground_truth(gt_filename, dims)
+    def __init__(self, gt_filename, dims, results, baseline, gt=None):
+        if gt is None:
+            gt = ObjectSet()
+            gt.load_ground_truth(gt_filename, dims)
+        self.gt = gt
         self.name = extract_sequence_name(gt_filename)
         self.file = results.new_file(self.name)
         self.file.frames = [{} for _ in range(self.gt.num_frames())]
@@ -190,10 +199,11 @@ class Evaluator:
         out.clear()
         out.iou_dt = [0.0] * len(dt.detections)
         out.iou_gt = [0.0] * len(gt)
-        for i, dt_detection in enumerate(dt.detections):
-            dt_points = dt_detection.get_points()
-            for j, gt_points in enumerate(gt):
-                score = iou(dt_points, gt_points)
+        gt_keys = [point_keys(gt_points) for gt_points in gt]
+        for i, dt_points in enumerate(dt.points):
+            dt_keys = point_keys(dt_points)
+            for j, keys in enumerate(gt_keys):
+                score = iou_keys(dt_keys, keys)
                 out.iou_gt[j] = max(out.iou_gt[j], score)
                 out.iou_dt[i] = max(out.iou_dt[i], score)
         for score in out.iou_gt:
@@ -289,14 +299,14 @@ class ObjectSet:
     def num_frames(self):
         return len(self.frames)
 
+def point_keys(points):
+    """Sorted unique integer keys of a point set, one per (x, y) point."""
+    return np.unique(pack_points(np.asarray(points, np.int64).reshape(-1, 2)))
+
+def iou_keys(keys1, keys2):
+    intersection = np.intersect1d(keys1, keys2, assume_unique=True).size
+    union = keys1.size + keys2.size - intersection
+    return intersection / union if union > 0 else 0.0
+
 def iou(ps1, ps2):
-    intersection = 0
-    union = 0
-    for p1 in ps1:
-        if p1 in ps2:
-            intersection += 1
-        union += 1
-    for p2 in ps2:
-        if p2 not in ps1:
-            union += 1
-    return intersection / union
+    return iou_keys(point_keys(ps1), point_keys(ps2))
@@ -6,6 +6,8 @@ import numpy as np
 from datetime import datetime
 from collections import deque
 from threading import Thread
+from recorder import ManualRecorder, make_automatic_recorder
+from snapshot import OutputSnapshot
 
 class Status:
     def __init__(self, args):
@@ -24,6 +26,10 @@ class Status:
         self.input_name = ""
         self.visualizer = None
         self.rpt = None
+        self.stage_times = None
+        self.cache = None
+        self.checkpoint = None
+        self.preview = None
 
     def have_camera(self):
         return self.args.camera != -1
@@ -73,7 +79,7 @@ class DebugVisualizer(Visualizer):
 
         if evaluator:
             status.window.print(eval_result.str())
-            gt = evaluator.gt().get(status.out_frame_num)
+            gt = evaluator.gt.get(status.out_frame_num)
             self.points_cache = self.merge_point_sets(self.object_points)
             self.gt_points_cache = self.merge_point_sets(gt)
             self.draw_points_gt(self.points_cache, self.gt_points_cache, self.vis)
@@ -231,7 +237,7 @@ class DemoVisualizer(Visualizer):
                 if self.manual:
                     self.manual = None
                 if not self.automatic:
-                    self.automatic = AutomaticRecorder(status.args.record_dir, frame.format, frame.shape[:2], 30)
+                    self.automatic = make_automatic_recorder(status.args, frame.format, frame.shape[:2], 30)
                     self.update_help(status)
             if command == "FORCED_EVENT":
                 self.forced_event = True
@@ -245,7 +251,7 @@ class DemoVisualizer(Visualizer):
                 if self.manual:
                     self.manual = None
                 elif not self.automatic:
-                    self.manual = ManualRecorder(status.args.record_dir, frame.format, frame.shape[:2], 30)
+                    self.manual = ManualRecorder(status.args.record_dir, frame.format, frame.shape[:2], 30, status.args.record_process)
             if command == "PLAY_SOUNDS":
                 status.sound = not status.sound
             if command == "LEVEL0":
@@ -434,7 +440,7 @@ class TUTDemoVisualizer(Visualizer):
 
     def visualize(self, status, frame, evaluator, eval_result, algorithm):
         if not self.vis1.manual and status.args.no_record:
-            self.vis1.manual = ManualRecorder(status.args.record_dir, frame.format, frame.shape[:2], 30)
+            self.vis1.manual = ManualRecorder(status.args.record_dir, frame.format, frame.shape[:2], 30, status.args.record_process)
         self.vis1.process(status, frame, algorithm)
         if self.last_detected_image is None:
             self.last_detected_image = frame.copy()
@@ -621,7 +627,7 @@ class RemovalVisualizer(Visualizer):
                 if self.manual:
                     self.manual = None
                 else:
-                    self.manual = ManualRecorder(status.args.record_dir, frame.format, frame.shape[:2], fps_estimate)
+                    self.manual = ManualRecorder(status.args.record_dir, frame.format, frame.shape[:2], fps_estimate, status.args.record_process)
 
             if not status.have_camera():
                 if command == "JUMP_BACKWARD":
@@ -679,7 +685,7 @@ def process_video(status, input_num):
     while not status.quit and not status.reload:
         allow_new_frames = True
         if evaluator:
-            num_gt_frames = evaluator.gt().num_frames()
+            num_gt_frames = evaluator.gt.num_frames()
             if status.out_frame_num > num_gt_frames:
                 break
             elif status.in_frame_num > num_gt_frames:
@@ -694,7 +700,7 @@ def process_video(status, input_num):
 
         frame_copy = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV) if format == "YUV" else frame.copy()
         algorithm.set_input_swap(frame_copy)
-        output_cache = algorithm.get_output(False)
+        output_cache = OutputSnapshot(algorithm, algorithm.get_output(False))
         stat.next_frame(len(output_cache.detections))
 
         if evaluator:
@@ -752,6 +758,10 @@ def main():
     parser.add_argument("--pause_im", action="store_true", help="Pause on improvements")
     parser.add_argument("--headless", action="store_true", help="Run without GUI")
     parser.add_argument("--no_record", action="store_true", help="Disable recording")
+    parser.add_argument("--record_process", action="store_true", help="Encode recordings in a separate process")
+    parser.add_argument("--preroll", type=float, help="Seconds of compressed pre-roll kept before automatic recording events")
+    parser.add_argument("--preroll_budget", type=float, default=512, help="Memory budget of the pre-roll buffer in MB")
+    parser.add_argument("--preroll_format", type=str, default="jpg", choices=["jpg", "png"], help="Pre-roll frame encoding")
     args = parser.parse_args()
 
     status = Status(args)
@@ -5,12 +5,20 @@ import datetime
 import cv2
 import numpy as np
 from args import Args
-from evaluator import Evaluator, Results, extractFilename
+from evaluator import Results
 from report import EvaluationReport, DetectionReport
+from loop_process import process_video
 from loop_visualizer import DebugVisualizer, DemoVisualizer, TUTDemoVisualizer, UTIADemoVisualizer, RemovalVisualizer
-from video import VideoInput
 from window import Window, Command
-from fmo import Algorithm, TimeUnit, Timer
+from fmo import TimeUnit, Timer
+import tracing
+from sweep import run_sweep
+from cache import EvaluationCache
+from shard import apply_shard
+from manifest import Manifest
+from checkpoint import Checkpoint
+from preview import PreviewServer
+from render import RenderThread
 
 class Status:
     def __init__(self, argc, argv):
@@ -20,27 +28,32 @@ class Status:
         self.baseline = Results()
         self.date = datetime.datetime.now()
         self.timer = Timer()
-        self.inputName = ""
+        self.input_name = ""
         self.visualizer = None
         self.rpt = None
-        self.inFrameNum = 0
-        self.outFrameNum = 0
+        self.stage_times = None
+        self.cache = None
+        self.checkpoint = None
+        self.preview = None
+        self.renderer = None
+        self.in_frame_num = 0
+        self.out_frame_num = 0
         self.paused = False
         self.quit = False
         self.reload = False
         self.sound = False
-        self.inputString = "Baseline"
+        self.input_string = "Baseline"
 
-    def haveCamera(self):
+    def have_camera(self):
         return self.args.camera != -1
 
-    def haveWait(self):
+    def have_wait(self):
         return self.args.wait != -1
 
-    def haveFrame(self):
+    def have_frame(self):
         return self.args.frame != -1
 
-    def unsetFrame(self):
+    def unset_frame(self):
         self.args.frame = -1
 
 def replace(string, old, new):
@@ -52,9 +65,9 @@ def printStatistics(stats):
     totalFrames = 0
     nDets = []
     for stat in stats:
-        nDets.append(stat.totalDetections)
-        totalSum += stat.totalDetections
-        totalFrames += stat.nFrames
+        nDets.append(stat.total_detections)
+        totalSum += stat.total_detections
+        totalFrames += stat.n_frames
     meanFrames = totalSum / totalFrames
     meanSeq = totalSum / len(stats)
     meanNFrames = totalFrames / len(stats)
@@ -63,101 +76,45 @@ def printStatistics(stats):
     print(f"Average number of frames - {meanNFrames}")
     print(f"Detections: total - {totalSum}, average per frame - {meanFrames}, average per sequence - {meanSeq}, median per sequence - {median}")
 
-def processVideo(s, inputNum):
-    if len(s.args.names) > inputNum:
-        print(f"Processing {s.args.names[inputNum]}")
-    input = VideoInput.makeFromFile(s.args.inputs[inputNum]) if not s.haveCamera() else VideoInput.makeFromCamera(s.args.camera)
-    if s.args.exposure != 100:
-        input.set_exposure(s.args.exposure)
-    if s.args.fps != -1:
-        input.set_fps(s.args.fps)
-    print(f"Exposure value: {input.get_exposure()}")
-    print(f"FPS: {input.fps()}")
-    dims = input.dims()
-    fps = input.fps()
-    s.inputName = extractFilename(s.args.inputs[inputNum]) if not s.haveCamera() else f"camera {s.args.camera}"
-    evaluator = None
-    if s.args.gts:
-        evaluator = Evaluator(s.args.gts[inputNum], dims, s.results, s.baseline)
-    elif s.args.gtDir:
-        evaluator = Evaluator(os.path.join(s.args.gtDir, f"{s.args.names[inputNum]}.txt"), dims, s.results, s.baseline)
-    sequenceReport = s.rpt.makeSequence(s.inputName) if s.rpt else None
-    if not s.haveCamera():
-        waitSec = s.args.wait / 1e3 if s.haveWait() else 1 / fps
-        s.window.setFrameTime(waitSec)
-    format = Algorithm.Format.YUV if s.args.yuv else Algorithm.Format.BGR
-    objectVec = [Algorithm.PointSet() for _ in range(1)]
-    algorithm = Algorithm.make(s.args.params, format, dims)
-    frame = None
-    frameCopy = Algorithm.Image(format, dims)
-    outputCache = Algorithm.Output()
-    evalResult = Evaluator.EvalResult()
-    s.inFrameNum = 1
-    s.outFrameNum = 1 + algorithm.getOutputOffset()
-    stat = Statistics()
-    while not s.quit and not s.reload:
-        allowNewFrames = True
-        if evaluator:
-            numGtFrames = evaluator.gt().numFrames()
-            if s.outFrameNum > numGtFrames:
-                break
-            elif s.inFrameNum > numGtFrames:
-                allowNewFrames = False
-        if allowNewFrames:
-            frame = input.receiveFrame()
-            if frame.data() is None:
-                break
-            if s.haveCamera():
-                Algorithm.flip(frame, frame)
-        Algorithm.convert(frame, frameCopy, format)
-        algorithm.setInputSwap(frameCopy)
-        algorithm.getOutput(outputCache, False)
-        stat.nextFrame(len(outputCache.detections))
-        if evaluator:
-            if s.outFrameNum >= 1:
-                evaluator.evaluateFrame(outputCache, s.outFrameNum, evalResult, s.args.params.iouThreshold)
-                if s.args.pauseFn and evalResult.eval[Evaluator.Event.FN] > 0:
-                    s.paused = True
-                if s.args.pauseFp and evalResult.eval[Evaluator.Event.FP] > 0:
-                    s.paused = True
-                if s.args.pauseRg and evalResult.comp == Evaluator.Comparison.REGRESSION:
-                    s.paused = True
-                if s.args.pauseIm and evalResult.comp == Evaluator.Comparison.IMPROVEMENT:
-                    s.paused = True
-            else:
-                evalResult.clear()
-                evalResult.comp = Evaluator.Comparison.BUFFERING
-        if sequenceReport:
-            sequenceReport.writeFrame(s.outFrameNum, outputCache, evalResult)
-        if s.args.frame == s.inFrameNum:
-            s.unsetFrame()
-            s.paused = True
-        if s.haveFrame():
-            continue
-        if s.args.headless and not s.paused:
-            continue
-        s.visualizer.visualize(s, frame, evaluator, evalResult, algorithm)
-    stat.print()
-    input.default_camera()
-    return stat
-
 def main(argc, argv):
+    preview = None
+    renderer = None
     try:
         s = Status(argc, argv)
-        if s.args.inputDir:
+        if s.args.input_dir:
             if not s.args.names:
-                path = os.path.join(s.args.inputDir.split("*")[0], "list.txt")
+                path = os.path.join(s.args.input_dir.split("*")[0], "list.txt")
                 with open(path, "r") as file:
                     s.args.names = [line.strip() for line in file]
             for name in s.args.names:
-                s.args.inputs.append(s.args.inputDir.replace("*", name))
+                s.args.inputs.append(s.args.input_dir.replace("*", name))
+        manifest = None
+        if s.args.manifest:
+            manifest = Manifest.load(s.args.manifest)
+            manifest.validate(s.args)
+        if s.args.shard:
+            apply_shard(s.args, s.args.shard, manifest)
         if s.args.baseline:
             s.baseline.load(s.args.baseline)
-        if s.haveCamera():
+        if s.args.trace_file:
+            tracing.start(s.args.trace_file)
+        if s.args.sweep:
+            run_sweep(s.args)
+            return 0
+        if s.args.eval_cache:
+            s.cache = EvaluationCache(s.args.eval_cache)
+        # opening a checkpoint without --resume starts it over, so only runs that write it open it
+        if s.args.checkpoint:
+            s.checkpoint = Checkpoint(s.args.checkpoint, s.args.parameters(), s.args.resume)
+        if s.args.preview_port is not None:
+            preview = s.preview = PreviewServer(s.args.preview_port, s.args.preview_fps, s.args.preview_quality)
+            preview.start()
+            s.window.preview = preview
+        if s.have_camera():
             s.args.inputs.append("")
-        if s.args.detectDir:
-            s.rpt = DetectionReport(s.args.detectDir, s.date)
-        demo = s.haveCamera()
+        if s.args.detect_dir:
+            s.rpt = DetectionReport(s.args.detect_dir, s.date)
+        demo = s.have_camera()
         if s.args.demo:
             demo = True
         if s.args.debug:
@@ -170,18 +127,27 @@ def main(argc, argv):
             s.visualizer = UTIADemoVisualizer(s)
         else:
             s.visualizer = DemoVisualizer(s) if demo else DebugVisualizer(s)
-        stats = [processVideo(s, i) for i in range(len(s.args.inputs)) if not s.quit]
+        # the window is only used from this thread, for every sequence of the run
+        renderer = s.renderer = RenderThread()
+        renderer.start()
+        stats = [process_video(s, i) for i in range(len(s.args.inputs)) if not s.quit]
         report = EvaluationReport(s.results, s.baseline, s.args, s.date, s.timer.toc(TimeUnit.SEC, float))
         report.write(sys.stdout)
         printStatistics(stats)
-        if s.args.evalDir:
-            report.save(s.args.evalDir)
-        if s.args.scoreFile:
-            report.saveScore(s.args.scoreFile)
+        if s.args.eval_dir:
+            report.save(s.args.eval_dir)
+        if s.args.score_file:
+            report.save_score(s.args.score_file)
     except Exception as e:
         print(f"error: {e}")
         print("tip: use --help to see a list of available commands")
         return -1
+    finally:
+        if renderer:
+            renderer.close()
+        if preview:
+            preview.close()
+        tracing.stop()
 
 if __name__ == "__main__":
     main(len(sys.argv), sys.argv)
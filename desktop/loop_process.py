@@ -1,11 +1,15 @@
 import time
+import threading
 import cv2
 import numpy as np
-from evaluator import Evaluator, EvalResult, Event, Comparison
+from evaluator import Evaluator, EvalResult, Event, Comparison, extract_sequence_name
 from video import VideoInput
-from recorder import ManualRecorder, DetectionReport
+from recorder import ManualRecorder
 from objectset import ObjectSet
 from algorithm import Algorithm
+from pipeline import Pipeline
+from stats import StageTimes
+from snapshot import OutputSnapshot
 
 class Statistics:
     def __init__(self):
@@ -22,9 +26,60 @@ class Statistics:
     def print(self):
         print(f"Detections: total - {self.total_detections}, average - {self.get_mean()}")
 
+    def summary(self):
+        return {"detections": self.total_detections, "frames": self.n_frames}
+
+    @staticmethod
+    def from_summary(summary):
+        stat = Statistics()
+        stat.total_detections = summary["detections"]
+        stat.n_frames = summary["frames"]
+        return stat
+
+class FrameJob:
+    def __init__(self, in_frame_num, out_frame_num, frame):
+        self.in_frame_num = in_frame_num
+        self.out_frame_num = out_frame_num
+        self.frame = frame
+        self.algorithm_input = None
+        self.output = None
+        self.eval_result = EvalResult()
+        self.visualized = threading.Event()
+
 def process_video(status, input_num):
     if len(status.args.names) > input_num:
         print(f"Processing {status.args.names[input_num]}")
+
+    gt_path = None
+    if status.args.gts:
+        gt_path = status.args.gts[input_num]
+    elif status.args.gt_dir:
+        gt_path = f"{status.args.gt_dir}{status.args.names[input_num]}.txt"
+    pause_options = status.args.pause_fn or status.args.pause_fp or status.args.pause_rg or status.args.pause_im
+    # the overlay must not go on showing the timings of the previous sequence
+    status.stage_times = None
+
+    if status.checkpoint and not status.have_camera():
+        summary = status.checkpoint.load(status.args.inputs[input_num], status.results)
+        if summary:
+            stat = Statistics.from_summary(summary)
+            print("Evaluation restored from checkpoint")
+            stat.print()
+            return stat
+
+    # a cached sequence is only reused when nothing but its evaluation would come out of the run
+    cache_key = None
+    if status.cache and gt_path and status.args.headless and not status.rpt and not pause_options and not status.have_frame():
+        cache_key = status.cache.key(status.args.inputs[input_num], gt_path, status.args)
+        summary = status.cache.load(cache_key, status.results)
+        if summary:
+            stat = Statistics.from_summary(summary)
+            print("Evaluation loaded from cache")
+            stat.print()
+            if status.checkpoint:
+                status.checkpoint.store(status.args.inputs[input_num], status.results.get_file(extract_sequence_name(gt_path)), summary)
+            return stat
+
     input = VideoInput.make_from_file(status.args.inputs[input_num]) if not status.have_camera() else VideoInput.make_from_camera(status.args.camera)
 
     if status.args.exposure != 100:
@@ -40,10 +95,7 @@ def process_video(status, input_num):
     status.input_name = status.args.inputs[input_num] if not status.have_camera() else f"camera {status.args.camera}"
 
     evaluator = None
-    if status.args.gts:
-        evaluator = Evaluator(status.args.gts[input_num], dims, status.results, status.baseline)
-    elif status.args.gt_dir:
-        gt_path = f"{status.args.gt_dir}{status.args.names[input_num]}.txt"
+    if gt_path:
         evaluator = Evaluator(gt_path, dims, status.results, status.baseline)
 
     sequence_report = None
@@ -54,71 +106,144 @@ def process_video(status, input_num):
         wait_sec = status.args.wait / 1e3 if status.have_wait() else 1 / fps
         status.window.set_frame_time(wait_sec)
 
-    format = status.args.yuv if status.args.yuv else "BGR"
-    object_vec = [None]
+    format = "YUV" if status.args.yuv else "BGR"
     algorithm = Algorithm.make(status.args.params, format, dims)
-    frame = None
-    frame_copy = np.zeros((dims[1], dims[0], 3), dtype=np.uint8)
-    output_cache = None
-    eval_result = EvalResult()
     status.in_frame_num = 1
     status.out_frame_num = 1 + algorithm.get_output_offset()
 
     stat = Statistics()
-    while not status.quit and not status.reload:
-        status.in_frame_num += 1
-        status.out_frame_num += 1
-
-        allow_new_frames = True
-        if evaluator:
-            num_gt_frames = evaluator.gt().num_frames()
-            if status.out_frame_num > num_gt_frames:
-                break
-            elif status.in_frame_num > num_gt_frames:
-                allow_new_frames = False
-
-        if allow_new_frames:
-            frame = input.receive_frame()
-            if frame is None:
-                break
-            if status.have_camera():
-                frame = cv2.flip(frame, 1)
-
-        frame_copy = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV) if format == "YUV" else frame.copy()
-        algorithm.set_input_swap(frame_copy)
-        output_cache = algorithm.get_output(False)
-        stat.next_frame(len(output_cache.detections))
-
-        if evaluator:
-            if status.out_frame_num >= 1:
-                evaluator.evaluate_frame(output_cache, status.out_frame_num, eval_result, status.args.params.iou_threshold)
-                if status.args.pause_fn and eval_result.eval[Event.FN] > 0:
-                    status.paused = True
-                if status.args.pause_fp and eval_result.eval[Event.FP] > 0:
-                    status.paused = True
-                if status.args.pause_rg and eval_result.comp == Comparison.REGRESSION:
-                    status.paused = True
-                if status.args.pause_im and eval_result.comp == Comparison.IMPROVEMENT:
-                    status.paused = True
-            else:
-                eval_result.clear()
-                eval_result.comp = Comparison.BUFFERING
-
+    times = StageTimes(status.input_name)
+    status.stage_times = times
+
+    def read_frames():
+        in_frame_num = status.in_frame_num
+        out_frame_num = status.out_frame_num
+        frame = None
+        while True:
+            allow_new_frames = True
+            if evaluator:
+                num_gt_frames = evaluator.gt.num_frames()
+                if out_frame_num > num_gt_frames:
+                    break
+                elif in_frame_num > num_gt_frames:
+                    allow_new_frames = False
+
+            if allow_new_frames:
+                start_ns = time.perf_counter_ns()
+                frame = input.receive_frame()
+                if frame is None:
+                    break
+                if status.have_camera():
+                    frame = cv2.flip(frame, 1)
+                times.add("decode", start_ns, time.perf_counter_ns(), in_frame_num)
+
+            yield FrameJob(in_frame_num, out_frame_num, frame)
+            in_frame_num += 1
+            out_frame_num += 1
+
+    def convert(job):
+        # the algorithm swaps its input with an internal buffer, so it is never given the decoded frame
+        job.algorithm_input = cv2.cvtColor(job.frame, cv2.COLOR_BGR2YUV) if format == "YUV" else job.frame.copy()
+
+    def detect(job):
+        start_ns = time.perf_counter_ns()
+        algorithm.set_input_swap(job.algorithm_input)
+        job.output = OutputSnapshot(algorithm, algorithm.get_output(False))
+        times.add("algorithm", start_ns, time.perf_counter_ns(), job.in_frame_num)
+        stat.next_frame(len(job.output.detections))
+        # from the frame given by --frame on, detection waits to pause there
+        seeking = status.have_frame() and job.in_frame_num >= status.args.frame
+        if not status.args.headless or status.paused or pause_options or seeking:
+            status.visualizer.prepare(job.output)
         if sequence_report:
-            sequence_report.write_frame(status.out_frame_num, output_cache, eval_result)
-
-        if status.args.frame == status.in_frame_num:
-            status.unset_frame()
-            status.paused = True
-
-        if status.have_frame():
-            continue
+            job.output.table()
+        job.output.detach()
+        # while paused or looking for frames to pause at, detection goes on frame by frame; the
+        # rest of the time it runs ahead of the display
+        if status.paused or pause_options or seeking:
+            pipeline.wait(job.visualized)
+
+    def evaluate(job):
+        if job.out_frame_num >= 1:
+            evaluator.evaluate_frame(job.output, job.out_frame_num, job.eval_result, status.args.params.iou_threshold)
+            if status.args.pause_fn and job.eval_result.eval[Event.FN] > 0:
+                status.paused = True
+            if status.args.pause_fp and job.eval_result.eval[Event.FP] > 0:
+                status.paused = True
+            if status.args.pause_rg and job.eval_result.comp == Comparison.REGRESSION:
+                status.paused = True
+            if status.args.pause_im and job.eval_result.comp == Comparison.IMPROVEMENT:
+                status.paused = True
+        else:
+            job.eval_result.comp = Comparison.BUFFERING
+
+    def report(job):
+        sequence_report.write_frame(job.out_frame_num, job.output, job.eval_result)
+
+    stages = [("convert", times.timed("convert", convert)), ("detect", detect)]
+    if evaluator:
+        stages.append(("evaluate", times.timed("evaluate", evaluate)))
+    if sequence_report:
+        stages.append(("report", times.timed("report", report)))
+
+    display_period_ns = int(1e9 / status.args.display_fps) if status.args.display_fps else 0
+    last_display_ns = 0
+
+    def update(job):
+        # the frame numbers are those of the frame being visualized, the processing loop may be ahead
+        status.in_frame_num = job.in_frame_num
+        status.out_frame_num = job.out_frame_num
+        status.visualizer.update(status, job.frame, job.output)
+
+    def render(job):
+        nonlocal last_display_ns
+        if status.quit or status.reload:
+            return
+        start_ns = time.perf_counter_ns()
+        # with --display-fps, frames that come sooner than the display period are not drawn
+        if not status.paused and start_ns - last_display_ns < display_period_ns:
+            return
+        last_display_ns = start_ns
+        was_paused = status.paused
+        status.visualizer.visualize(status, job.frame, evaluator, job.eval_result, algorithm, job.output)
+        if not was_paused and not status.paused:
+            times.add("visualize", start_ns, time.perf_counter_ns(), job.in_frame_num)
+
+    pipeline = Pipeline(read_frames, stages)
+    status.renderer.begin(update, render)
+    pipeline.start()
+    try:
+        for job in pipeline:
+            if status.quit or status.reload:
+                break
 
-        if status.args.headless and not status.paused:
-            continue
+            if status.args.frame == job.in_frame_num:
+                status.paused = True
+                status.unset_frame()
 
-        status.visualizer.visualize(status, frame, evaluator, eval_result, algorithm)
+            if not status.have_frame() and not (status.args.headless and not status.paused):
+                status.renderer.submit(job)
+                if status.paused:
+                    pipeline.wait(job.visualized)
+            else:
+                status.in_frame_num = job.in_frame_num
+                status.out_frame_num = job.out_frame_num
+                if status.preview:
+                    status.preview.publish(job.frame, job.output.all_points)
+                job.visualized.set()
+    finally:
+        pipeline.close()
+        status.renderer.finish()
 
     stat.print()
+    times.finish()
+    times.print()
+    if status.args.stage_times:
+        times.save(status.args.stage_times)
+    if evaluator and not status.quit and not status.reload:
+        if cache_key:
+            status.cache.store(cache_key, evaluator.file, stat.summary())
+        if status.checkpoint and not status.have_camera():
+            status.checkpoint.store(status.args.inputs[input_num], evaluator.file, stat.summary())
     input.default_camera()
     return stat
@@ -1,13 +1,36 @@
+import os
+import threading
 import cv2
 import numpy as np
 from collections import deque
 from datetime import datetime
+from recorder import ManualRecorder, make_automatic_recorder
+from snapshot import merge_points
+from video import VideoInput
 
 class Visualizer:
-    def visualize(self, status, frame, evaluator, eval_result, algorithm):
+    def prepare(self, output):
+        """Called on the detection thread while the algorithm is still on the frame of output.
+
+        Requests everything that visualize will need from the algorithm besides the detections,
+        so that the frame can be visualized after the algorithm has moved on.
+        """
+        pass
+
+    def update(self, status, frame, output):
+        """Called for every frame in order, also for those that are not going to be shown.
+
+        Keeps the state that has to see every frame, such as trajectories or a history of frames;
+        visualize then only draws the current state.
+        """
+        pass
+
+    def visualize(self, status, frame, evaluator, eval_result, algorithm, output):
         raise NotImplementedError
 
 class DebugVisualizer(Visualizer):
+    POINT_KERNEL = cv2.circle(np.zeros((5, 5), np.uint8), (2, 2), 2, 1, -1)
+
     def __init__(self, status):
         self.stats = deque(maxlen=60)
         self.level = 1
@@ -15,35 +38,33 @@ class DebugVisualizer(Visualizer):
         self.show_im = True
         self.add = 0
         self.vis = None
+        self.mask = None
         self.detections = 0
         self.pause_first = False
         self.previous_det = 0
 
-    def process(self, status, frame, evaluator, eval_result, algorithm):
+    def process(self, status, frame, evaluator, eval_result, algorithm, output):
         self.stats.append(datetime.now())
         fps_last = len(self.stats) / (self.stats[-1] - self.stats[0]).total_seconds()
 
-        self.vis = algorithm.get_debug_image(self.level, self.show_im, self.show_lm, self.add)
+        self.vis = output.debug_image(self.level, self.show_im, self.show_lm, self.add)
         status.window.print(status.input_name)
         status.window.print(f"frame: {status.in_frame_num}")
         status.window.print(f"fps: {fps_last:.2f}")
+        if status.stage_times:
+            for line in status.stage_times.lines():
+                status.window.print(line)
 
-        algorithm.get_output(self.output_cache, False)
-        self.object_points = []
-        for detection in self.output_cache.detections:
-            points = detection.get_points()
-            self.object_points.append(points)
-        self.detections = len(self.output_cache.detections)
+        self.detections = len(output.detections)
 
         if evaluator:
             status.window.print(eval_result.str())
-            gt = evaluator.gt().get(status.out_frame_num)
-            self.points_cache = self.merge_points(self.object_points)
-            self.gt_points_cache = self.merge_points(gt)
-            self.draw_points_gt(self.points_cache, self.gt_points_cache, self.vis)
+            gt = evaluator.gt.get(status.out_frame_num)
+            self.gt_points_cache = merge_points(gt)
+            self.draw_points_gt(output.all_points, self.gt_points_cache, self.vis)
             status.window.set_text_color(self.good(eval_result.eval))
         else:
-            self.draw_points(self.points_cache, self.vis, (255, 0, 255))
+            self.draw_points(output.all_points, self.vis, (255, 0, 255))
 
     def process_keyboard(self, status, frame):
         step = False
@@ -98,26 +119,34 @@ class DebugVisualizer(Visualizer):
                     status.args.frame = status.in_frame_num + 10
             self.previous_det = self.detections
 
-    def visualize(self, status, frame, evaluator, eval_result, algorithm):
-        self.process(status, frame, evaluator, eval_result, algorithm)
+    def prepare(self, output):
+        output.debug_image(self.level, self.show_im, self.show_lm, self.add)
+
+    def visualize(self, status, frame, evaluator, eval_result, algorithm, output):
+        self.process(status, frame, evaluator, eval_result, algorithm, output)
         status.window.display(self.vis)
         self.process_keyboard(status, frame)
 
-    def merge_points(self, points_list):
-        merged_points = []
-        for points in points_list:
-            merged_points.extend(points)
-        return merged_points
+    def point_mask(self, points, shape):
+        # every point becomes a disc of radius 2, drawn by dilating a mask of the points instead
+        # of calling cv2.circle for each of them
+        if self.mask is None or self.mask.shape != shape[:2]:
+            self.mask = np.zeros(shape[:2], np.uint8)
+        else:
+            self.mask.fill(0)
+        h, w = shape[:2]
+        inside = (points[:, 0] >= 0) & (points[:, 0] < w) & (points[:, 1] >= 0) & (points[:, 1] < h)
+        self.mask[points[inside, 1], points[inside, 0]] = 1
+        return cv2.dilate(self.mask, self.POINT_KERNEL).view(bool)
 
     def draw_points_gt(self, points, gt_points, image):
-        for point in points:
-            cv2.circle(image, point, 2, (255, 0, 255), -1)
-        for point in gt_points:
-            cv2.circle(image, point, 2, (0, 255, 0), -1)
+        points_mask = self.point_mask(points, image.shape)
+        gt_mask = self.point_mask(gt_points, image.shape)
+        image[points_mask & ~gt_mask] = (255, 0, 255)
+        image[gt_mask] = (0, 255, 0)
 
     def draw_points(self, points, image, color):
-        for point in points:
-            cv2.circle(image, point, 2, color, -1)
+        image[self.point_mask(points, image.shape)] = color
 
     def good(self, eval):
         return eval[0] == 0 and eval[1] == 0
@@ -133,8 +162,14 @@ class UTIADemoVisualizer(Visualizer):
         self.offset_from_max = 0
         self.last_mode = -1
 
-    def visualize(self, status, frame, evaluator, eval_result, algorithm):
-        self.vis1.process(status, frame, algorithm)
+    def prepare(self, output):
+        self.vis1.prepare(output)
+
+    def update(self, status, frame, output):
+        self.vis1.update(status, frame, output)
+
+    def visualize(self, status, frame, evaluator, eval_result, algorithm, output):
+        self.vis1.process(status, frame, output)
         if self.last_detected_image is None:
             self.last_detected_image = frame.copy()
         if self.max_detected_image is None:
@@ -164,38 +199,144 @@ class UTIADemoVisualizer(Visualizer):
         self.previous_detections = self.vis1.m_number_detections
         self.last_mode = self.vis1.mode
 
+class PrefetchedClip:
+    """A showcase clip decoded on a background thread into memory and played in a loop.
+
+    Frames are kept at the size of the clip, the grid scales them into its cell. At most BUDGET
+    bytes of them are kept; a longer clip loops over its beginning. Until loading finishes, the
+    clip plays the frames that are ready and holds the last one.
+    """
+    BUDGET = 256 * 1024 * 1024
+
+    def __init__(self, paths):
+        self.frames = []
+        self.complete = False
+        self.position = 0
+        self.thread = threading.Thread(target=self.load, args=(paths,), name="clip", daemon=True)
+        self.thread.start()
+
+    def load(self, paths):
+        try:
+            for path in paths:
+                if os.path.exists(path):
+                    input = VideoInput.make_from_file(path)
+                    break
+            else:
+                return
+            size = 0
+            while True:
+                frame = input.receive_frame()
+                if frame is None or (self.frames and size + frame.nbytes > self.BUDGET):
+                    break
+                size += frame.nbytes
+                self.frames.append(frame)
+        except RuntimeError:
+            pass
+        finally:
+            self.complete = True
+
+    def next(self):
+        num_frames = len(self.frames)
+        if num_frames == 0:
+            return None
+        if self.complete:
+            frame = self.frames[self.position % num_frames]
+            self.position += 1
+        else:
+            frame = self.frames[min(self.position, num_frames - 1)]
+            self.position = min(self.position + 1, num_frames)
+        return frame
+
+class GridCompositor:
+    """Puts images side by side into a canvas that is allocated once and reused for every frame.
+
+    Each image is resized straight into its cell of the canvas. A cell is only drawn again when
+    it is given a different array than last time, so a source that is modified in place has to
+    be passed to invalidate(). The window draws its text over the canvas it displays, the cells
+    under the text are passed to invalidate_rects() to be drawn again.
+    """
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.canvas = None
+        self.sources = []
+
+    def allocate(self, dims):
+        w, h = dims
+        self.canvas = np.zeros((h * self.rows, w * self.cols, 3), np.uint8)
+        self.sources = [None] * (self.rows * self.cols)
+
+    def cell(self, i):
+        h = self.canvas.shape[0] // self.rows
+        w = self.canvas.shape[1] // self.cols
+        r, c = divmod(i, self.cols)
+        return self.canvas[r * h:(r + 1) * h, c * w:(c + 1) * w]
+
+    def invalidate(self, i=None):
+        if i is None:
+            self.sources = [None] * len(self.sources)
+        else:
+            self.sources[i] = None
+
+    def invalidate_rects(self, rects):
+        """Invalidate the cells that any of the (x0, y0, x1, y1) rectangles of the canvas touches."""
+        if self.canvas is None:
+            return
+        h = self.canvas.shape[0] // self.rows
+        w = self.canvas.shape[1] // self.cols
+        for x0, y0, x1, y1 in rects:
+            for r in range(y0 // h, min((y1 - 1) // h + 1, self.rows)):
+                for c in range(x0 // w, min((x1 - 1) // w + 1, self.cols)):
+                    self.sources[r * self.cols + c] = None
+
+    def compose(self, imgs, dims):
+        """Draw the images that changed into the cells, row by row, and return the composite."""
+        if self.canvas is None or self.canvas.shape[:2] != (dims[1] * self.rows, dims[0] * self.cols):
+            self.allocate(dims)
+        for i, img in enumerate(imgs):
+            if img is self.sources[i]:
+                continue
+            cell = self.cell(i)
+            if img.shape[:2] == cell.shape[:2]:
+                np.copyto(cell, img)
+            else:
+                cv2.resize(img, dims, dst=cell)
+            self.sources[i] = img
+        return self.canvas
+
 class TUTDemoVisualizer(Visualizer):
+    CLIPS = ["circle_back_res.avi", "counting_all_res.avi", "floorball_res.avi"]
+    CLIP_DIRS = ["../data/webcam", "data/webcam"]
+    # the difference image and the distance transform with local maxima, shown in mode 2
+    DEBUG_IMAGES = [(1, True, False, 1), (1, True, True, 3)]
+
     def __init__(self, status):
         self.vis1 = DemoVisualizer(status)
-        self.input = []
-        try:
-            self.input.append(VideoInput.make_from_file("../data/webcam/circle_back_res.avi"))
-            self.input.append(VideoInput.make_from_file("../data/webcam/counting_all_res.avi"))
-            self.input.append(VideoInput.make_from_file("../data/webcam/floorball_res.avi"))
-        except Exception:
-            self.input.clear()
-            try:
-                self.input.append(VideoInput.make_from_file("data/webcam/circle_back_res.avi"))
-                self.input.append(VideoInput.make_from_file("data/webcam/counting_all_res.avi"))
-                self.input.append(VideoInput.make_from_file("data/webcam/floorball_res.avi"))
-            except Exception:
-                pass
+        self.clips = None
         status.window.set_top_line("Fast Moving Objects Detection")
         self.record = not status.args.no_record
         if self.record:
-            self.vis1.m_record_annotations = False
+            self.vis1.record_annotations = False
         self.vis = None
-        self.temp_debug = None
-        self.temp2_debug = None
+        self.grid = GridCompositor(2, 2)
         self.offset_from_max = 0
         self.last_detected_image = None
         self.max_detected_image = None
         self.last_mode = -1
 
-    def visualize(self, status, frame, evaluator, eval_result, algorithm):
-        if not self.vis1.m_manual and self.record:
-            self.vis1.m_manual = ManualRecorder(status.args.record_dir, frame.format(), frame.dims(), 30)
-        self.vis1.process(status, frame, algorithm)
+    def prepare(self, output):
+        self.vis1.prepare(output)
+        if self.vis1.mode == 2:
+            for args in self.DEBUG_IMAGES:
+                output.debug_image(*args)
+
+    def update(self, status, frame, output):
+        if not self.vis1.manual and self.record:
+            self.vis1.manual = ManualRecorder(status.args.record_dir, frame.format(), frame.dims(), 30, status.args.record_process)
+        self.vis1.update(status, frame, output)
+
+    def visualize(self, status, frame, evaluator, eval_result, algorithm, output):
+        self.vis1.process(status, frame, output)
         if self.last_detected_image is None:
             self.last_detected_image = frame.copy()
         if self.max_detected_image is None:
@@ -208,33 +349,29 @@ class TUTDemoVisualizer(Visualizer):
         else:
             self.offset_from_max += 1
 
+        dims = (frame.shape[1], frame.shape[0])
+        if self.clips is None:
+            self.clips = [PrefetchedClip([os.path.join(dir, name) for dir in self.CLIP_DIRS]) for name in self.CLIPS]
+
         if self.vis1.mode == 0:
-            self.vis = np.zeros((2 * frame.shape[0], 2 * frame.shape[1], 3), dtype=np.uint8)
             imgs = []
-            for in_video in self.input:
-                next_frame = in_video.receive_frame()
-                if next_frame is None:
-                    in_video.restart()
-                    next_frame = in_video.receive_frame()
-                imgs.append(next_frame)
-            for _ in range(len(imgs), 4):
-                imgs.append(self.vis1.vis)
-            self.vis = self.imgridfull(imgs, 2, 2)
-            status.window.display(self.vis)
+            for clip in self.clips:
+                next_frame = clip.next()
+                imgs.append(next_frame if next_frame is not None else self.vis1.vis)
+            imgs.append(self.vis1.vis)
+            self.vis = self.grid.compose(imgs, dims)
+            self.grid.invalidate_rects(status.window.display(self.vis))
         elif self.vis1.mode == 1:
             status.window.display(self.vis1.vis)
         elif self.vis1.mode == 2:
-            self.vis = np.zeros((2 * frame.shape[0], 2 * frame.shape[1], 3), dtype=np.uint8)
-            imgs = [frame]
-            temp = algorithm.get_debug_image(1, True, False, 1)
-            temp = cv2.resize(temp, (frame.shape[1], frame.shape[0]))
-            imgs.append(temp)
-            temp2 = algorithm.get_debug_image(1, True, True, 3)
-            temp2 = cv2.resize(temp2, (frame.shape[1], frame.shape[0]))
-            imgs.append(temp2)
-            imgs.append(self.vis1.vis)
-            self.vis = self.imgridfull(imgs, 2, 2)
-            status.window.display(self.vis)
+            # right after switching to this mode, the frame stands in for images not captured yet
+            debug_images = [output.debug_image(*args) for args in self.DEBUG_IMAGES]
+            imgs = [frame] + [image if image is not None else frame for image in debug_images] + [self.vis1.vis]
+            # the algorithm may hand out the same buffer every frame, refilled in place
+            for i in range(1, 1 + len(self.DEBUG_IMAGES)):
+                self.grid.invalidate(i)
+            self.vis = self.grid.compose(imgs, dims)
+            self.grid.invalidate_rects(status.window.display(self.vis))
         elif self.vis1.mode == 3:
             if self.last_mode != self.vis1.mode:
                 self.vis = frame.copy()
@@ -253,34 +390,59 @@ class TUTDemoVisualizer(Visualizer):
         self.previous_detections = self.vis1.m_number_detections
         self.last_mode = self.vis1.mode
 
-    def imgridfull(self, imgs, rows, cols):
-        h, w = imgs[0].shape[:2]
-        grid = np.zeros((h * rows, w * cols, 3), dtype=np.uint8)
-        for i, img in enumerate(imgs):
-            r = i // cols
-            c = i % cols
-            grid[r * h:(r + 1) * h, c * w:(c + 1) * w] = img
-        return grid
-
     def putcorner(self, src, dst):
         h, w = src.shape[:2]
         dst[:h, :w] = src
 
+# fractional bits of the polyline coordinates, as cv::ellipse draws them
+CURVE_SHIFT = 16
+
+def curve_polyline(curve):
+    """Sample a trajectory curve into the polyline its draw_smooth would draw, in image coordinates
+    with CURVE_SHIFT fractional bits.
+
+    Returns None for a kind of curve that cannot be sampled here.
+    """
+    if hasattr(curve, "radius"):
+        # a circular arc, sampled the way cv::ellipse samples it
+        if curve.radius <= 0:
+            return None
+        axis = int(round(curve.radius / curve.scale)) << CURVE_SHIFT
+        center = (int(round(curve.x / curve.scale)) << CURVE_SHIFT, int(round(curve.y / curve.scale)) << CURVE_SHIFT)
+        size = (axis + (1 << CURVE_SHIFT) - 1) >> CURVE_SHIFT
+        delta = 90 if size < 3 else 30 if size < 10 else 18 if size < 15 else 5
+        return cv2.ellipse2Poly(center, (axis, axis), 0, round(curve.start_degree_smooth), round(curve.end_degree_smooth), delta)
+    if hasattr(curve, "start_smooth"):
+        if curve.start.x == 0 and curve.start.y == 0:
+            return None
+        ends = [(curve.start_smooth.x, curve.start_smooth.y), (curve.end_smooth.x, curve.end_smooth.y)]
+        return np.round(np.array(ends) / curve.scale).astype(np.int32) << CURVE_SHIFT
+    return None
+
 class DemoVisualizer(Visualizer):
+    SEGMENTS = 200
+    CURVES = 20
+    THICKNESS = 8
+
     def __init__(self, status):
-        self.stats = deque(maxlen=60)
         self.show_help = False
         self.automatic = None
         self.manual = None
         self.record_annotations = True
         self.forced_event = False
         self.output = None
-        self.segments = []
-        self.curves = []
+        self.segments = deque(maxlen=self.SEGMENTS)
+        self.curves = deque(maxlen=self.CURVES)
+        self.overlay = None
+        self.overlay_mask = None
+        self.new_segments = []
+        self.evicted_segments = 0
+        self.rebuild = False
         self.events_detected = 0
         self.max_detections = 0
         self.last_detect_frame = -12
         self.vis = None
+        self.record_vis = None
         self.mode = 0
         self.number_detections = 0
         self.offset_from_max_detection = 0
@@ -304,7 +466,7 @@ class DemoVisualizer(Visualizer):
                 help_text += " | [s] enable sound"
             status.window.set_bottom_line(help_text)
 
-    def print_status(self, status, fps_estimate):
+    def print_status(self, status):
         recording = self.automatic.is_recording() if self.automatic else bool(self.manual)
         kmh = True
         meas = " km/h" if kmh else " mph"
@@ -314,6 +476,9 @@ class DemoVisualizer(Visualizer):
         for i, speed in enumerate(self.speeds):
             status.window.print(f"Speed {i + 1} : {round(speed * fctr * 100) / 100:.2f}{meas}")
         status.window.print(f"Max speed: {round(self.max_speed * fctr * 100) / 100:.2f}{meas}", (255, 0, 0))
+        if status.stage_times:
+            for line in status.stage_times.lines():
+                status.window.print(line)
 
         status.window.set_text_color((255, 0, 0) if recording else (192, 192, 192))
 
@@ -324,15 +489,22 @@ class DemoVisualizer(Visualizer):
             self.events_detected += 1
             self.segments.clear()
             self.curves.clear()
+            self.new_segments.clear()
+            self.rebuild = True
         self.last_detect_frame = status.out_frame_num
 
         if detection.predecessor.have_center():
-            segment = (detection.predecessor.center, detection.object.center)
-            self.segments.append(segment)
+            start = detection.predecessor.center
+            end = detection.object.center
+            if len(self.segments) == self.segments.maxlen:
+                self.evicted_segments += 1
+            self.segments.append(np.array([[start.x, start.y], [end.x, end.y]], np.int32))
+            self.new_segments.append((self.segments[-1], len(self.segments) - 1))
         elif detection.object.curve:
             curve = detection.object.curve.clone()
             curve.scale = detection.object.scale
-            self.curves.append(curve)
+            # the polyline is sampled once, when the curve is created
+            self.curves.append((curve, curve_polyline(curve)))
             radius_cm = status.args.radius
             sp = 0
             fps_real = 29.97
@@ -362,27 +534,49 @@ class DemoVisualizer(Visualizer):
         if detection.object.curve:
             self.max_speed = speed_now
 
-        if len(self.segments) > 200:
-            self.segments = self.segments[len(self.segments) // 2:]
-
-        while len(self.curves) > 20:
-            self.curves.pop(0)
+        # segments that fell out of the history stay on the overlay until half of the history
+        # is replaced, so that the overlay is not redrawn for every new segment
+        if self.evicted_segments > self.SEGMENTS // 2:
+            self.rebuild = True
+
+    def trajectory_color(self, index):
+        # trajectories fade from magenta to white, segments first, then curves
+        return (255, min(index + 1, 255), 255)
+
+    def update_overlay(self, shape):
+        """Draw the segments added since the last call onto the overlay, or all of them when some
+        were removed. The mask gets the same drawing, it tells which pixels of the overlay are set."""
+        if self.overlay is None or self.overlay.shape != shape:
+            self.overlay = np.zeros(shape, np.uint8)
+            self.overlay_mask = np.zeros(shape[:2], np.uint8)
+            self.rebuild = True
+        if self.rebuild:
+            self.overlay.fill(0)
+            self.overlay_mask.fill(0)
+            self.new_segments = list(zip(self.segments, range(len(self.segments))))
+            self.evicted_segments = 0
+            self.rebuild = False
+        for segment, index in self.new_segments:
+            cv2.polylines(self.overlay, [segment], False, self.trajectory_color(index), self.THICKNESS)
+            cv2.polylines(self.overlay_mask, [segment], False, 255, self.THICKNESS)
+        self.new_segments.clear()
 
     def draw_segments(self, image):
-        color = (255, 0, 255)
-        thickness = 8
-        for segment in self.segments:
-            color = (min(color[0] + 2, 255), min(color[1] + 1, 255), min(color[2] + 4, 255))
-            cv2.line(image, segment[0], segment[1], color, thickness)
-        for curve in self.curves:
-            color = (min(color[0] + 2, 255), min(color[1] + 1, 255), min(color[2] + 4, 255))
-            curve.draw_smooth(image, color, thickness)
-
-    def process(self, status, frame, algorithm):
-        self.stats.append(datetime.now())
-        fps_estimate = len(self.stats) / (self.stats[-1] - self.stats[0]).total_seconds()
+        self.update_overlay(image.shape)
+        cv2.copyTo(self.overlay, self.overlay_mask, image)
+        # the few curves go over the segments, their colours follow the number of segments
+        for i, (curve, polyline) in enumerate(self.curves):
+            color = self.trajectory_color(len(self.segments) + i)
+            if polyline is None:
+                curve.draw_smooth(image, color, self.THICKNESS)
+            else:
+                cv2.polylines(image, [polyline], False, color, self.THICKNESS, shift=CURVE_SHIFT)
+
+    def prepare(self, output):
+        output.smoothed()
 
-        algorithm.get_output(self.output, True)
+    def update(self, status, frame, output):
+        self.output = output.smoothed()
         self.number_detections = len(self.output.detections)
         if self.number_detections > 0:
             self.speeds.clear()
@@ -396,27 +590,37 @@ class DemoVisualizer(Visualizer):
             self.offset_from_max_detection = 0
             self.max_detections = self.number_detections
 
-        self.vis = frame.copy()
         for detection in self.output.detections:
             self.on_detection(status, detection)
+        self.record(status, frame)
 
-        self.draw_segments(self.vis)
-        self.print_status(status, fps_estimate)
-
-    def process_keyboard(self, status, frame):
-        if self.automatic:
-            event = self.forced_event or bool(self.output.detections)
-            if self.record_annotations:
-                self.automatic.frame(self.vis, event)
-            else:
-                self.automatic.frame(frame, event)
-        elif self.manual:
-            if self.record_annotations:
-                self.manual.frame(self.vis)
+    def record(self, status, frame):
+        """Pass the frame to the active recorder. Every frame is recorded and checked for an event,
+        also the frames that --display-fps or a slow display leave out."""
+        if self.automatic or self.manual:
+            image = self.annotate(status, frame) if self.record_annotations else frame
+            if self.automatic:
+                self.automatic.frame(image, self.forced_event or bool(self.output.detections))
             else:
-                self.manual.frame(frame)
+                self.manual.frame(image)
         self.forced_event = False
 
+    def annotate(self, status, frame):
+        # the recorded frame gets the trajectories and the text the window would draw over it
+        if self.record_vis is None or self.record_vis.shape != frame.shape:
+            self.record_vis = np.empty_like(frame)
+        np.copyto(self.record_vis, frame)
+        self.draw_segments(self.record_vis)
+        self.print_status(status)
+        status.window.printText(self.record_vis)
+        return self.record_vis
+
+    def process(self, status, frame, output):
+        self.vis = frame.copy()
+        self.draw_segments(self.vis)
+        self.print_status(status)
+
+    def process_keyboard(self, status, frame):
         step = False
         while status.paused and not status.quit and not step:
             command = status.window.get_command(False)
@@ -487,7 +691,7 @@ class DemoVisualizer(Visualizer):
                 if self.manual:
                     self.manual = None
                 if not self.automatic:
-                    self.automatic = AutomaticRecorder(status.args.record_dir, frame.format(), frame.dims(), 30)
+                    self.automatic = make_automatic_recorder(status.args, frame.format(), frame.dims(), 30)
                     self.update_help(status)
             if command == "FORCED_EVENT":
                 self.forced_event = True
@@ -501,7 +705,7 @@ class DemoVisualizer(Visualizer):
                 if self.manual:
                     self.manual = None
                 elif not self.automatic:
-                    self.manual = ManualRecorder(status.args.record_dir, frame.format(), frame.dims(), 30)
+                    self.manual = ManualRecorder(status.args.record_dir, frame.format(), frame.dims(), 30, status.args.record_process)
             if command == "PLAY_SOUNDS":
                 status.sound = not status.sound
             if command == "LEVEL0":
@@ -515,42 +719,81 @@ class DemoVisualizer(Visualizer):
             if command == "LEVEL4":
                 self.mode = 4
 
-    def visualize(self, status, frame, evaluator, eval_result, algorithm):
-        self.process(status, frame, algorithm)
+    def visualize(self, status, frame, evaluator, eval_result, algorithm, output):
+        self.process(status, frame, output)
         status.window.display(self.vis)
         self.process_keyboard(status, frame)
 
 class RemovalVisualizer(Visualizer):
+    HISTORY = 5
+
     def __init__(self, status):
         self.stats = deque(maxlen=60)
-        self.frames = [None] * 5
-        self.current = None
-        self.output_cache = None
-        self.object_points = []
-        self.points_cache = []
+        self.ring = None
+        self.mask = None
+        self.vis = None
+        self.median = None
+        self.above = None
+        self.below = None
+        self.use_median = status.args.removal_median
         self.events_detected = 0
+        self.composed = None
         self.manual = None
 
-    def visualize(self, status, frame, evaluator, eval_result, algorithm):
+    def allocate(self, shape):
+        self.ring = np.empty((self.HISTORY,) + shape, np.uint8)
+        self.mask = np.zeros(shape[:2] + (1,), bool)
+        self.vis = np.empty(shape, np.uint8)
+        if self.use_median:
+            self.median = None
+            self.above = np.empty(shape, bool)
+            self.below = np.empty(shape, bool)
+
+    def past(self, age):
+        # frame received `age` frames ago, the ring is filled in order of arrival
+        return self.ring[(self.events_detected - 1 - age) % self.HISTORY]
+
+    def update_median(self, frame):
+        # approximate temporal median: every pixel moves one level towards the current frame,
+        # so that it settles on the value that is above as often as below
+        if self.median is None:
+            self.median = frame.copy()
+            return
+        np.greater(frame, self.median, out=self.above)
+        np.less(frame, self.median, out=self.below)
+        np.add(self.median, self.above, out=self.median, casting="unsafe")
+        np.subtract(self.median, self.below, out=self.median, casting="unsafe")
+
+    def update(self, status, frame, output):
         self.events_detected += 1
-        self.stats.append(datetime.now())
-        fps_estimate = len(self.stats) / (self.stats[-1] - self.stats[0]).total_seconds()
-
-        self.current = frame.copy()
-        self.frames[4], self.frames[3], self.frames[2], self.frames[1], self.frames[0] = self.frames[3], self.frames[2], self.frames[1], self.frames[0], self.current
-
-        vis = self.frames[min(0 - algorithm.get_output_offset(), self.events_detected - 1)]
-        bg = self.frames[min(self.events_detected - 1, 4)]
-
-        algorithm.get_output(self.output_cache, False)
-        self.object_points = [detection.get_points() for detection in self.output_cache.detections]
-        self.points_cache = self.merge_points(self.object_points)
+        if self.ring is None or self.ring.shape[1:] != frame.shape:
+            self.allocate(frame.shape)
+            self.events_detected = 1
+        np.copyto(self.ring[(self.events_detected - 1) % self.HISTORY], frame)
+        if self.use_median:
+            self.update_median(frame)
+        # every frame is recorded, also the frames that are not shown
+        if self.manual:
+            self.compose(output)
+            self.manual.frame(self.vis)
 
-        self.remove_points(self.points_cache, vis, bg)
+    def compose(self, output):
+        """Draw the frame of output with the detected objects removed into vis."""
+        np.copyto(self.vis, self.past(min(0 - output.output_offset, self.events_detected - 1)))
+        bg = self.median if self.use_median else self.past(min(self.events_detected - 1, self.HISTORY - 1))
+        self.remove_points(output.all_points, self.vis, bg)
+        self.composed = output
 
-        if self.manual:
-            self.manual.frame(vis)
+    def visualize(self, status, frame, evaluator, eval_result, algorithm, output):
+        self.stats.append(datetime.now())
+        fps_estimate = len(self.stats) / (self.stats[-1] - self.stats[0]).total_seconds()
 
+        if self.composed is not output:
+            self.compose(output)
+        vis = self.vis
+        if status.stage_times:
+            for line in status.stage_times.lines():
+                status.window.print(line)
         status.window.display(vis)
 
         step = False
@@ -577,14 +820,9 @@ class RemovalVisualizer(Visualizer):
                 if self.manual:
                     self.manual = None
                 else:
-                    self.manual = ManualRecorder(status.args.record_dir, frame.format(), frame.dims(), fps_estimate)
-
-    def merge_points(self, points_list):
-        merged_points = []
-        for points in points_list:
-            merged_points.extend(points)
-        return merged_points
+                    self.manual = ManualRecorder(status.args.record_dir, frame.format(), frame.dims(), fps_estimate, status.args.record_process)
 
     def remove_points(self, points, vis, bg):
-        for point in points:
-            vis[point[1], point[0]] = bg[point[1], point[0]]
+        self.mask.fill(False)
+        self.mask[points[:, 1], points[:, 0]] = True
+        np.copyto(vis, bg, where=self.mask)
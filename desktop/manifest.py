@@ -0,0 +1,131 @@
+import os
+import json
+import argparse
+import cv2
+from cache import file_stamp, hash_file
+
+def gt_path(args, input_num):
+    if args.gts:
+        return args.gts[input_num]
+    if args.gt_dir:
+        return f"{args.gt_dir}{args.names[input_num]}.txt"
+    return None
+
+def read_gt_header(path):
+    # W H F may share a line or be on lines of their own, only as much of the file as they take is read
+    with open(path, "r") as f:
+        tokens = (token for line in f for token in line.split())
+        try:
+            width, height, num_frames = [int(next(tokens)) for _ in range(3)]
+        except StopIteration:
+            raise ValueError(f"ground truth '{path}' ends in its header")
+    return [width, height], num_frames
+
+def probe(video, gt):
+    capture = cv2.VideoCapture(video)
+    if not capture.isOpened():
+        raise RuntimeError(f"Failed to open video source '{video}'")
+    entry = {
+        "dims": [int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))],
+        "fps": capture.get(cv2.CAP_PROP_FPS),
+        "frames": int(capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "stamp": file_stamp(video),
+        "hash": hash_file(video),
+    }
+    capture.release()
+    if gt:
+        entry["gt"] = gt
+        entry["gt_dims"], entry["gt_frames"] = read_gt_header(gt)
+        entry["gt_stamp"] = file_stamp(gt)
+        entry["gt_hash"] = hash_file(gt)
+    return entry
+
+class Manifest:
+    """Facts about each sequence of a dataset, gathered once so that runs can plan their work
+    without opening every video. Entries are keyed by the video path as given on the command line.
+    """
+    VERSION = 1
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    @staticmethod
+    def load(file):
+        with open(file, "r") as f:
+            data = json.load(f)
+        if data.get("version") != Manifest.VERSION:
+            raise ValueError(f"unsupported manifest version in '{file}'")
+        return Manifest(data["sequences"])
+
+    def save(self, file):
+        temp = f"{file}.{os.getpid()}.tmp"
+        with open(temp, "w") as f:
+            json.dump({"version": self.VERSION, "sequences": self.entries}, f, indent=1)
+        os.replace(temp, file)
+
+    def current(self, video, gt):
+        entry = self.entries.get(video)
+        if not entry or entry["stamp"] != file_stamp(video):
+            return False
+        if gt:
+            return entry.get("gt") == gt and entry["gt_stamp"] == file_stamp(gt)
+        return "gt" not in entry
+
+    def update(self, args):
+        """Add the inputs of args, probing only the sequences that are new or changed."""
+        for input_num, video in enumerate(args.inputs):
+            gt = gt_path(args, input_num)
+            if not self.current(video, gt):
+                print(f"Probing {video}")
+                self.entries[video] = probe(video, gt)
+                if input_num < len(args.names):
+                    self.entries[video]["name"] = args.names[input_num]
+
+    def frames(self, video):
+        # when there is ground truth, it decides how many frames get processed
+        entry = self.entries[video]
+        return entry.get("gt_frames", entry["frames"])
+
+    def longest_first(self, videos):
+        return sorted(videos, key=lambda video: -self.frames(video))
+
+    def validate(self, args):
+        problems = []
+        for input_num, video in enumerate(args.inputs):
+            if not self.current(video, gt_path(args, input_num)):
+                problems.append(f"{video}: missing or out of date, rebuild the manifest")
+                continue
+            entry = self.entries[video]
+            if "gt" in entry and entry["gt_dims"] != entry["dims"]:
+                problems.append(f"{video}: dimensions inconsistent with GT, {entry['dims']} vs {entry['gt_dims']}")
+        if problems:
+            raise ValueError("manifest check failed\n" + "\n".join(problems))
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a manifest of a dataset for scheduling and validation.")
+    parser.add_argument("--input", type=str, nargs='+', help="<path> Path to an input video file.")
+    parser.add_argument("--input-dir", type=str, help="<path> Template for input videos, the asterisk (*) is replaced by each name in list.txt (in the directory).")
+    parser.add_argument("--gt", type=str, nargs='+', help="<path> Ground truth file of each --input.")
+    parser.add_argument("--gt-dir", type=str, help="<path> Directory with ground truth files named after the sequences.")
+    parser.add_argument("--name", type=str, nargs='+', help="<string> Names of the sequences. By default they are read from list.txt when --input-dir is used.")
+    parser.add_argument("--output", type=str, required=True, help="<file> Manifest file. If it exists, only new or changed sequences are probed.")
+    args = parser.parse_args()
+    args.inputs = args.input or []
+    args.gts = args.gt or []
+    args.names = args.name or []
+    if args.input_dir:
+        if not args.names:
+            path = os.path.join(args.input_dir.split("*")[0], "list.txt")
+            with open(path, "r") as file:
+                args.names = [line.strip() for line in file]
+        args.inputs = [args.input_dir.replace("*", name) for name in args.names]
+
+    manifest = Manifest.load(args.output) if os.path.exists(args.output) else Manifest()
+    manifest.update(args)
+    manifest.save(args.output)
+    for video in manifest.longest_first(args.inputs):
+        entry = manifest.entries[video]
+        print(f"{manifest.frames(video):>7} {entry['dims'][0]}x{entry['dims'][1]} {entry['fps']:.2f} fps  {video}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import queue
+import threading
+
+class Pipeline:
+    QUEUE_SIZE = 4
+    POLL_SEC = 0.05
+
+    def __init__(self, source, stages):
+        self.stopping = threading.Event()
+        self.error = None
+        self.queues = [queue.Queue(self.QUEUE_SIZE) for _ in range(len(stages) + 1)]
+        self.threads = [threading.Thread(target=self.source_impl, args=(source, self.queues[0]), name="decode")]
+        for i, (name, stage) in enumerate(stages):
+            thread = threading.Thread(target=self.stage_impl, args=(stage, self.queues[i], self.queues[i + 1]), name=name)
+            self.threads.append(thread)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def source_impl(self, source, output):
+        try:
+            for item in source():
+                if not self.put(output, item):
+                    return
+        except Exception as e:
+            self.fail(e)
+            return
+        self.put(output, None)
+
+    def stage_impl(self, stage, input, output):
+        while True:
+            item = self.get(input)
+            if item is None:
+                break
+            try:
+                stage(item)
+            except Exception as e:
+                self.fail(e)
+                return
+            if not self.put(output, item):
+                return
+        self.put(output, None)
+
+    def fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.stopping.set()
+
+    def get(self, q):
+        while True:
+            try:
+                return q.get(timeout=self.POLL_SEC)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return None
+
+    def put(self, q, item):
+        while not self.stopping.is_set():
+            try:
+                q.put(item, timeout=self.POLL_SEC)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def wait(self, event):
+        while not event.wait(self.POLL_SEC):
+            if self.stopping.is_set():
+                return False
+        return True
+
+    def __iter__(self):
+        while True:
+            item = self.get(self.queues[-1])
+            if item is None:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,116 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+from window import Colour, drawPoints
+
+def make_handler(preview):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/":
+                self.send_error(404)
+                return
+            preview.stream(self)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class PreviewServer:
+    """Serves the latest published image as an MJPEG stream on localhost, so that runs without a
+    window, such as with --headless, can be watched in a browser.
+
+    Publishing only stores a reference to the image. Images are encoded on a worker thread, at
+    most `fps` times per second, and only while a client is connected.
+    """
+    BOUNDARY = b"frame"
+
+    def __init__(self, port, fps, quality):
+        self.period = 1 / fps
+        self.quality = quality
+        self.condition = threading.Condition()
+        self.image = None
+        self.points = None
+        self.published = 0
+        self.jpeg = None
+        self.encoded = 0
+        self.clients = 0
+        self.stopping = False
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(self))
+        self.server.daemon_threads = True
+        self.threads = [
+            threading.Thread(target=self.server.serve_forever, name="preview-http"),
+            threading.Thread(target=self.encode_impl, name="preview-encode"),
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        print(f"Preview at http://127.0.0.1:{self.server.server_address[1]}/")
+
+    def has_clients(self):
+        return self.clients > 0
+
+    def publish(self, image, points=None):
+        """Offer an image for the stream. It must not be modified afterwards, so callers that reuse
+        their buffers pass a copy. Points given as an (n, 2) array are drawn over the image."""
+        if not self.clients:
+            return
+        with self.condition:
+            self.image = image
+            self.points = points
+            self.published += 1
+            self.condition.notify_all()
+
+    def encode_impl(self):
+        last = 0
+        while True:
+            with self.condition:
+                while not self.stopping and (self.clients == 0 or self.published == last):
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                image, points, last = self.image, self.points, self.published
+            if points is not None and len(points) > 0:
+                image = image.copy()
+                drawPoints(points, image, Colour.lightMagenta())
+            ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if ok:
+                with self.condition:
+                    self.jpeg = data.tobytes()
+                    self.encoded += 1
+                    self.condition.notify_all()
+            time.sleep(self.period)
+
+    def stream(self, handler):
+        with self.condition:
+            self.clients += 1
+        try:
+            handler.send_response(200)
+            handler.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={self.BOUNDARY.decode()}")
+            handler.send_header("Cache-Control", "no-cache")
+            handler.end_headers()
+            seen = 0
+            while True:
+                with self.condition:
+                    while self.encoded == seen and not self.stopping:
+                        self.condition.wait()
+                    if self.stopping:
+                        return
+                    jpeg, seen = self.jpeg, self.encoded
+                handler.wfile.write(b"--" + self.BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.condition:
+                self.clients -= 1
+
+    def close(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+        for thread in self.threads:
+            thread.join()
@@ -1,42 +1,151 @@
 import os
+import time
 import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
 import cv2
 import numpy as np
+import tracing
 
 class RecordingThread:
-    def __init__(self, dir, format, dims, fps):
+    def __init__(self, dir, format, dims, fps, slots=8, policy=None):
         self.format = format
         self.dims = dims
         self.video_output = VideoOutput.make_in_directory(dir, dims, fps)
-        self.stop = False
-        self.exchange = Exchange(format, dims)
-        self.thread = threading.Thread(target=self.thread_impl)
+        self.exchange = Exchange(format, dims, slots, policy or Exchange.DROP_OLDEST)
+        self.thread = threading.Thread(target=self.thread_impl, name="recorder")
         self.thread.start()
 
     def thread_impl(self):
         input_image = np.zeros((self.dims[1], self.dims[0], 3), dtype=np.uint8)
-        while not self.stop:
-            self.exchange.swap_receive(input_image)
-            if self.stop:
+        while True:
+            received = self.exchange.swap_receive(input_image)
+            if received is None:
                 return
+            input_image = received
+            start_ns = tracing.now()
             self.video_output.send_frame(input_image)
+            tracing.complete("encode", start_ns, tracing.now())
 
     def swap_send(self, input_image):
+        start_ns = tracing.now()
         self.exchange.swap_send(input_image)
+        tracing.complete("record", start_ns, tracing.now())
 
-    def __del__(self):
-        self.stop = True
+    def counters(self):
+        return self.exchange.counters()
+
+    def close(self):
         self.exchange.exit()
-        self.thread.join()
+        if self.thread.is_alive():
+            self.thread.join()
+            self.video_output.release()
+
+    def __del__(self):
+        self.close()
+
+class RecordingProcess:
+    POLL_SEC = 0.1
+
+    def __init__(self, dir, format, dims, fps, slots=8, policy=None):
+        policy = policy or Exchange.DROP_NEWEST
+        if policy not in (Exchange.BLOCK, Exchange.DROP_NEWEST):
+            raise ValueError(f"overflow policy not supported out of process: {policy}")
+        self.format = format
+        self.dims = dims
+        self.policy = policy
+        self.shape = (dims[1], dims[0], 3)
+        frame_bytes = dims[0] * dims[1] * 3
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * frame_bytes)
+        self.slots = [np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=i * frame_bytes) for i in range(slots)]
+        self.tail = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.peak_depth = 0
+        context = multiprocessing.get_context("spawn")
+        self.free = context.Semaphore(slots)
+        self.filled = context.Semaphore(0)
+        self.sent = context.Value("q", 0, lock=False)
+        self.received = context.Value("q", 0, lock=False)
+        self.process = context.Process(target=encode_shared_frames, args=(self.shm.name, dims, slots, dir, fps, self.free, self.filled, self.sent, self.received))
+        self.process.start()
+
+    def swap_send(self, input_image):
+        start_ns = tracing.now()
+        acquired = self.free.acquire(block=False)
+        # a blocked sender gives up once the encoder process is gone, it would never free a slot
+        while not acquired and self.policy == Exchange.BLOCK and self.process.is_alive():
+            acquired = self.free.acquire(timeout=self.POLL_SEC)
+        if not acquired:
+            self.dropped += 1
+            tracing.complete("record", start_ns, tracing.now(), dropped=True)
+            return
+        np.copyto(self.slots[self.tail], input_image)
+        self.tail = (self.tail + 1) % len(self.slots)
+        self.enqueued += 1
+        self.sent.value = self.enqueued
+        self.peak_depth = max(self.peak_depth, self.enqueued - self.received.value)
+        self.filled.release()
+        tracing.complete("record", start_ns, tracing.now())
+
+    def counters(self):
+        return {"enqueued": self.enqueued, "dropped": self.dropped, "peak_depth": self.peak_depth}
+
+    def close(self):
+        if self.shm is None:
+            return
+        if self.process.is_alive():
+            self.filled.release()
+            self.process.join()
+        # the segment is removed also when the encoder process died on its own
+        self.slots = []
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __del__(self):
+        self.close()
+
+def encode_shared_frames(shm_name, dims, slots, dir, fps, free, filled, sent, received):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frame_bytes = dims[0] * dims[1] * 3
+    video_output = VideoOutput.make_in_directory(dir, dims, fps)
+    head = 0
+    while True:
+        filled.acquire()
+        if received.value == sent.value:
+            break
+        frame = np.ndarray((dims[1], dims[0], 3), dtype=np.uint8, buffer=shm.buf, offset=head * frame_bytes)
+        video_output.send_frame(frame)
+        del frame
+        head = (head + 1) % slots
+        received.value += 1
+        free.release()
+    video_output.release()
+    shm.close()
+
+def make_recording(dir, format, dims, fps, out_of_process=False, policy=None):
+    if out_of_process:
+        return RecordingProcess(dir, format, dims, fps, policy=policy)
+    return RecordingThread(dir, format, dims, fps, policy=policy)
+
+def make_automatic_recorder(args, format, dims, fps):
+    if not args.preroll:
+        return AutomaticRecorder(args.record_dir, format, dims, fps, args.record_process)
+    budget = int(args.preroll_budget * 2 ** 20)
+    return PrerollRecorder(args.record_dir, format, dims, fps, args.record_process, args.preroll, budget, "." + args.preroll_format)
 
 class AutomaticRecorder:
     NUM_FRAMES = 60
 
-    def __init__(self, dir, format, dims, fps):
+    def __init__(self, dir, format, dims, fps, out_of_process=False):
         self.dir = dir
         self.format = format
         self.dims = dims
         self.fps = fps
+        self.out_of_process = out_of_process
         self.images = [np.zeros((dims[1], dims[0], 3), dtype=np.uint8) for _ in range(self.NUM_FRAMES)]
         self.head = 0
         self.stop_at = 0
@@ -46,10 +155,11 @@ class AutomaticRecorder:
     def frame(self, input_image, event):
         self.frame_num += 1
         if self.thread and self.stop_at == self.head:
+            self.thread.close()
             self.thread = None
         if event:
             if not self.thread:
-                self.thread = RecordingThread(self.dir, self.format, self.dims, self.fps)
+                self.thread = make_recording(self.dir, self.format, self.dims, self.fps, self.out_of_process)
             self.stop_at = self.head
         self.head = (self.head + 1) % self.NUM_FRAMES
         if self.thread and self.frame_num > self.NUM_FRAMES:
@@ -63,49 +173,230 @@ class AutomaticRecorder:
         while self.thread:
             self.frame(self.images[self.head], False)
 
+class CompressedFrameBuffer:
+    def __init__(self, budget, max_frames, ext=".jpg", quality=90, workers=2):
+        if ext == ".jpg":
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif ext == ".png":
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        else:
+            raise ValueError(f"unsupported pre-roll encoding: {ext}")
+        self.ext = ext
+        self.budget = budget
+        self.max_frames = max_frames
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.frames = deque()
+        self.bytes = 0
+
+    def submit(self, image):
+        return self.pool.submit(self.encode, image.copy())
+
+    def push(self, image):
+        self.frames.append(self.submit(image))
+        self.trim()
+
+    def trim(self):
+        while len(self.frames) > self.max_frames or (self.frames and self.bytes > self.budget):
+            self.release(self.frames.popleft().result())
+
+    def take(self):
+        frames = self.frames
+        self.frames = deque()
+        return frames
+
+    def encode(self, image):
+        ok, data = cv2.imencode(self.ext, image, self.params)
+        if not ok:
+            raise RuntimeError("failed to encode pre-roll frame")
+        with self.lock:
+            self.bytes += data.nbytes
+        return data
+
+    def decode(self, future):
+        data = future.result()
+        self.release(data)
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+    def release(self, data):
+        with self.lock:
+            self.bytes -= data.nbytes
+
+    def __del__(self):
+        self.pool.shutdown()
+
+class PrerollFlush:
+    def __init__(self, buffer, recording):
+        self.buffer = buffer
+        self.recording = recording
+        # the compressed pre-roll is written first, the live frames queue up raw behind it
+        self.preroll = buffer.take()
+        self.live = deque()
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.thread_impl, name="preroll-flush")
+        self.thread.start()
+
+    def push(self, image):
+        image = image.copy()
+        with self.condition:
+            self.live.append(image)
+            self.condition.notify()
+
+    def thread_impl(self):
+        while True:
+            with self.condition:
+                while not self.preroll and not self.live and not self.closed:
+                    self.condition.wait()
+                if self.preroll:
+                    future = self.preroll.popleft()
+                    image = None
+                elif self.live:
+                    image = self.live.popleft()
+                else:
+                    break
+            if image is None:
+                start_ns = tracing.now()
+                image = self.buffer.decode(future)
+                tracing.complete("preroll-decode", start_ns, tracing.now())
+            self.recording.swap_send(image)
+        self.recording.close()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+class PrerollRecorder:
+    POST_FRAMES = 60
+
+    def __init__(self, dir, format, dims, fps, out_of_process, seconds, budget, ext=".jpg"):
+        self.dir = dir
+        self.format = format
+        self.dims = dims
+        self.fps = fps
+        self.out_of_process = out_of_process
+        self.buffer = CompressedFrameBuffer(budget, max(1, int(seconds * fps)), ext)
+        self.flush = None
+        self.finishing = []
+        self.frames_left = 0
+
+    def frame(self, input_image, event):
+        if event:
+            if not self.flush:
+                recording = make_recording(self.dir, self.format, self.dims, self.fps, self.out_of_process, Exchange.BLOCK)
+                self.flush = PrerollFlush(self.buffer, recording)
+            self.frames_left = self.POST_FRAMES
+        if self.flush:
+            self.flush.push(input_image)
+            self.frames_left -= 1
+            if self.frames_left == 0:
+                self.flush.close()
+                self.finishing.append(self.flush)
+                self.flush = None
+        else:
+            self.buffer.push(input_image)
+        self.finishing = [flush for flush in self.finishing if flush.thread.is_alive()]
+
+    def is_recording(self):
+        return self.flush is not None
+
+    def __del__(self):
+        if self.flush:
+            self.flush.close()
+            self.finishing.append(self.flush)
+        for flush in self.finishing:
+            flush.thread.join()
+
 class ManualRecorder:
-    def __init__(self, dir, format, dims, fps):
-        self.image = np.zeros((dims[1], dims[0], 3), dtype=np.uint8)
-        self.thread = RecordingThread(dir, format, dims, fps)
+    def __init__(self, dir, format, dims, fps, out_of_process=False):
+        self.thread = make_recording(dir, format, dims, fps, out_of_process)
 
     def frame(self, input_image):
-        self.image = input_image.copy()
-        self.thread.swap_send(self.image)
+        self.thread.swap_send(input_image)
 
     def __del__(self):
-        pass
+        self.thread.close()
 
 class VideoOutput:
+    def __init__(self, writer):
+        self.writer = writer
+
     @staticmethod
     def make_in_directory(dir, dims, fps):
         fourcc = cv2.VideoWriter_fourcc(*'XVID')
         filename = os.path.join(dir, f"output_{int(time.time())}.avi")
-        return cv2.VideoWriter(filename, fourcc, fps, (dims[0], dims[1]))
+        return VideoOutput(cv2.VideoWriter(filename, fourcc, fps, (dims[0], dims[1])))
 
     def send_frame(self, frame):
-        self.write(frame)
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
 
 class Exchange:
-    def __init__(self, format, dims):
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    DROP_NEWEST = "drop-newest"
+
+    def __init__(self, format, dims, slots=1, policy=DROP_OLDEST):
+        if slots < 1:
+            raise ValueError("exchange needs at least one slot")
+        if policy not in (self.BLOCK, self.DROP_OLDEST, self.DROP_NEWEST):
+            raise ValueError(f"unknown overflow policy: {policy}")
         self.format = format
         self.dims = dims
-        self.buffer = None
+        self.policy = policy
+        self.slots = [np.zeros((dims[1], dims[0], 3), dtype=np.uint8) for _ in range(slots)]
+        self.head = 0
+        self.depth = 0
+        self.exited = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.peak_depth = 0
         self.lock = threading.Lock()
         self.condition = threading.Condition(self.lock)
 
     def swap_send(self, input_image):
         with self.lock:
-            self.buffer = input_image.copy()
-            self.condition.notify()
+            if self.depth == len(self.slots):
+                if self.policy == self.BLOCK:
+                    while self.depth == len(self.slots) and not self.exited:
+                        self.condition.wait()
+                    if self.exited:
+                        return
+                elif self.policy == self.DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                else:
+                    self.head = (self.head + 1) % len(self.slots)
+                    self.depth -= 1
+                    self.dropped += 1
+            tail = (self.head + self.depth) % len(self.slots)
+            np.copyto(self.slots[tail], input_image)
+            self.depth += 1
+            self.enqueued += 1
+            self.peak_depth = max(self.peak_depth, self.depth)
+            self.condition.notify_all()
 
     def swap_receive(self, output_image):
         with self.lock:
-            while self.buffer is None:
+            while self.depth == 0 and not self.exited:
                 self.condition.wait()
-            output_image[:] = self.buffer
-            self.buffer = None
+            if self.depth == 0:
+                return None
+            received = self.slots[self.head]
+            self.slots[self.head] = output_image
+            self.head = (self.head + 1) % len(self.slots)
+            self.depth -= 1
+            self.condition.notify_all()
+            return received
+
+    def counters(self):
+        with self.lock:
+            return {"enqueued": self.enqueued, "dropped": self.dropped, "peak_depth": self.peak_depth}
 
     def exit(self):
         with self.lock:
-            self.buffer = None
+            self.exited = True
             self.condition.notify_all()
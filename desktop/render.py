@@ -0,0 +1,92 @@
+import threading
+
+class RenderThread:
+    """Visualizes processed frames on a thread of its own, so that detection never waits for the
+    display or the window system.
+
+    One render thread serves the whole run, so that the window is only ever used from one
+    thread. Each sequence installs its own update and render with begin and waits for its last
+    frame with finish.
+
+    Every submitted frame is passed to update, in order, but only the latest of the frames that
+    arrived while the previous one was being rendered is passed to render. When the display falls
+    behind, the frames in between are skipped. At most QUEUE_SIZE frames wait for update; submit
+    blocks until there is room.
+    """
+    QUEUE_SIZE = 4
+
+    def __init__(self):
+        self.update = None
+        self.render = None
+        self.condition = threading.Condition()
+        self.pending = []
+        self.busy = False
+        self.stopping = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="render")
+
+    def start(self):
+        self.thread.start()
+
+    def begin(self, update, render):
+        with self.condition:
+            self.update = update
+            self.render = render
+
+    def submit(self, job):
+        with self.condition:
+            while len(self.pending) >= self.QUEUE_SIZE and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                job.visualized.set()
+                raise self.error
+            self.pending.append(job)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                jobs = self.pending
+                self.pending = []
+                self.busy = True
+                update = self.update
+                render = self.render
+                self.condition.notify_all()
+            try:
+                for job in jobs:
+                    update(job)
+                    if job is not jobs[-1]:
+                        job.visualized.set()
+                render(jobs[-1])
+            except Exception as e:
+                with self.condition:
+                    self.error = e
+                    jobs += self.pending
+                    self.pending = []
+                return
+            finally:
+                for job in jobs:
+                    job.visualized.set()
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def finish(self):
+        """Wait until the frames submitted so far are visualized, and raise the error of the thread
+        if visualization failed."""
+        with self.condition:
+            while (self.pending or self.busy) and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+
+    def close(self):
+        # the frames still waiting are rendered before the thread ends
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.thread.join()
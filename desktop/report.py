@@ -249,37 +249,36 @@ class DetectionReport:
             if not alg_out.detections:
                 return
             self.report.out.write(f"    <frame num=\"{frame_num}\">\n")
-            for i, detection in enumerate(alg_out.detections):
-                if detection.object.have_id():
-                    self.report.out.write(f"      <detection id=\"{detection.object.id}\">\n")
+            for i, record in enumerate(alg_out.table()):
+                if record["id"] != -1:
+                    self.report.out.write(f"      <detection id=\"{record['id']}\">\n")
                 else:
                     self.report.out.write('      <detection>\n')
 
-                if detection.predecessor.have_id():
-                    self.report.out.write(f"        <predecessor>{detection.predecessor.id}</predecessor>\n")
+                if record["predecessor_id"] != -1:
+                    self.report.out.write(f"        <predecessor>{record['predecessor_id']}</predecessor>\n")
 
-                if detection.object.have_center():
-                    self.report.out.write(f"        <center x=\"{detection.object.center.x}\" y=\"{detection.object.center.y}\"/>\n")
+                if record["center"][0] != -1:
+                    self.report.out.write(f"        <center x=\"{record['center'][0]}\" y=\"{record['center'][1]}\"/>\n")
 
-                if detection.object.have_direction():
-                    self.report.out.write(f"        <direction x=\"{detection.object.direction[0]}\" y=\"{detection.object.direction[1]}\"/>\n")
+                if record["direction"].any():
+                    self.report.out.write(f"        <direction x=\"{record['direction'][0]}\" y=\"{record['direction'][1]}\"/>\n")
 
-                if detection.object.have_length():
-                    self.report.out.write(f"        <length unit=\"px\">{detection.object.length}</length>\n")
+                if record["length"] >= 0:
+                    self.report.out.write(f"        <length unit=\"px\">{record['length']}</length>\n")
 
-                if detection.object.have_radius():
-                    self.report.out.write(f"        <radius unit=\"px\">{detection.object.radius}</radius>\n")
+                if record["radius"] >= 0:
+                    self.report.out.write(f"        <radius unit=\"px\">{record['radius']}</radius>\n")
 
-                if detection.object.have_velocity():
-                    self.report.out.write(f"        <velocity unit=\"px/frame\">{detection.object.velocity}</velocity>\n")
+                if record["velocity"] >= 0:
+                    self.report.out.write(f"        <velocity unit=\"px/frame\">{record['velocity']}</velocity>\n")
 
                 if len(eval_res.iou_dt) > i:
                     self.report.out.write(f"        <iou>{eval_res.iou_dt[i]}</iou>\n")
 
                 self.report.out.write('        <points>')
-                points = detection.get_points()
-                for p in points:
-                    self.report.out.write(f"{p.x} {p.y} ")
+                for x, y in alg_out.points[i].tolist():
+                    self.report.out.write(f"{x} {y} ")
                 self.report.out.write('</points>\n')
 
                 self.report.out.write('      </detection>\n')
@@ -0,0 +1,135 @@
+import sys
+import argparse
+import cv2
+from datetime import datetime
+from evaluator import Results
+from report import EvaluationReport
+from manifest import gt_path, read_gt_header
+
+def parse_shard(spec):
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"bad shard '{spec}', expected <i>/<n>")
+    if count < 1 or index < 1 or index > count:
+        raise ValueError(f"bad shard '{spec}', expected 1 <= i <= n")
+    return index, count
+
+def count_frames(args, input_num):
+    # the ground truth header is much cheaper to read than the video, and it also limits the
+    # number of frames that get processed
+    path = gt_path(args, input_num)
+    if path:
+        return read_gt_header(path)[1]
+    capture = cv2.VideoCapture(args.inputs[input_num])
+    num_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return num_frames
+
+def select_shard(frames, index, count):
+    """Split sequences with the given frame counts into `count` shards with similar total frame
+    counts and return the sequence indices in shard `index`, in their original order.
+
+    Sequences are handed out longest first, each to the shard with the fewest frames so far. Ties
+    are broken by position, so every machine computes the same split from the same list.
+    """
+    loads = [0] * count
+    selected = []
+    for i in sorted(range(len(frames)), key=lambda i: (-frames[i], i)):
+        shard = min(range(count), key=lambda k: (loads[k], k))
+        loads[shard] += frames[i]
+        if shard == index - 1:
+            selected.append(i)
+    return sorted(selected)
+
+def apply_shard(args, spec, manifest=None):
+    index, count = parse_shard(spec)
+    if manifest:
+        frames = [manifest.frames(video) for video in args.inputs]
+    else:
+        frames = [count_frames(args, i) for i in range(len(args.inputs))]
+    selected = select_shard(frames, index, count)
+    print(f"Shard {index}/{count}: {len(selected)} of {len(frames)} sequences, {sum(frames[i] for i in selected)} of {sum(frames)} frames")
+    args.inputs = [args.inputs[i] for i in selected]
+    if args.names:
+        args.names = [args.names[i] for i in selected]
+    if args.gts:
+        args.gts = [args.gts[i] for i in selected]
+
+class MergedArgs:
+    """Stands in for Args when writing the report of merged results."""
+    def __init__(self, names, parameters):
+        self.names = names
+        self.parameters_string = parameters
+
+    def parameters(self):
+        return self.parameters_string
+
+def merge(files, order=None):
+    """Read several saved results files into a single Results.
+
+    Each file is streamed and only the parsed results are kept in memory. Sequences are put in the
+    given order, so that the merged report lists them exactly as a single run over the same list.
+    All files must have been run with the same parameters.
+    Returns the results, the parameters line and the sum of evaluation times of the reports.
+    """
+    merged = Results()
+    parameters = None
+    first = None
+    seconds = 0.0
+    for file in files:
+        part = Results()
+        file_parameters = ""
+        with open(file, "r") as f:
+            # saved reports start with a text header, collect what is needed before the results
+            for line in f:
+                if line.startswith("parameters: "):
+                    file_parameters = line[len("parameters: "):].strip()
+                elif line.startswith("evaluation time: "):
+                    seconds += float(line.split()[2])
+                elif line.strip() == "":
+                    break
+            f.seek(0)
+            part.read(f)
+        if parameters is None:
+            parameters = file_parameters
+            first = file
+        elif file_parameters != parameters:
+            raise ValueError(f"'{file}' was run with parameters '{file_parameters}', but '{first}' with '{parameters}'")
+        for file_results in part.list:
+            if file_results.name in merged.map:
+                raise ValueError(f"sequence '{file_results.name}' found in more than one results file")
+            merged.list.append(file_results)
+            merged.map[file_results.name] = file_results
+
+    if order:
+        position = {name.replace(" ", "_"): i for i, name in enumerate(order)}
+        missing = [file.name for file in merged.list if file.name not in position]
+        if missing:
+            raise ValueError(f"sequences missing from the list: {' '.join(missing)}")
+        merged.list.sort(key=lambda file: position[file.name])
+        merged.map = {file.name: file for file in merged.list}
+    return merged, parameters or "", seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge evaluation results of several shards into a single report.")
+    parser.add_argument("results", type=str, nargs="+", help="<file> Results saved with --eval-dir by each shard.")
+    parser.add_argument("--list", type=str, help="<path> Sequence list (such as list.txt used with --input-dir) giving the order of sequences in the report. Without it, sequences keep the order of the results files.")
+    parser.add_argument("--eval-dir", type=str, help="<dir> Directory to save the merged report to.")
+    args = parser.parse_args()
+
+    names = []
+    if args.list:
+        with open(args.list, "r") as file:
+            names = [line.strip() for line in file if line.strip()]
+    results, parameters, seconds = merge(args.results, names)
+    # the report labels its rows by position, so it gets the names of the merged sequences only
+    label = {name.replace(" ", "_"): name for name in names}
+    names = [label[file.name] for file in results.list] if names else []
+    report = EvaluationReport(results, Results(), MergedArgs(names, parameters), datetime.now(), seconds)
+    report.write(sys.stdout)
+    if args.eval_dir:
+        report.save(args.eval_dir)
+
+if __name__ == "__main__":
+    main()
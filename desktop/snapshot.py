@@ -0,0 +1,101 @@
+import numpy as np
+
+# one record per detection; missing values use the same markers as fmo::Algorithm::Detection,
+# i.e. -1 for ids, centers, length, radius and velocity, and a zero direction
+DETECTION_DTYPE = np.dtype([
+    ("id", np.int32),
+    ("predecessor_id", np.int32),
+    ("center", np.int32, (2,)),
+    ("predecessor_center", np.int32, (2,)),
+    ("direction", np.float32, (2,)),
+    ("length", np.float32),
+    ("radius", np.float32),
+    ("velocity", np.float32),
+])
+
+def detections_array(detections):
+    """Collect the attributes of all detections of a frame into one structured array."""
+    table = np.empty(len(detections), DETECTION_DTYPE)
+    for i, detection in enumerate(detections):
+        obj = detection.object
+        predecessor = detection.predecessor
+        table[i] = (obj.id, predecessor.id, (obj.center.x, obj.center.y), (predecessor.center.x, predecessor.center.y),
+                    (obj.direction[0], obj.direction[1]), obj.length, obj.radius, obj.velocity)
+    return table
+
+def points_array(points):
+    """Convert a point set into an (n, 2) int32 array of x, y coordinates."""
+    if len(points) == 0:
+        return np.empty((0, 2), np.int32)
+    if hasattr(points[0], "x"):
+        return np.array([(p.x, p.y) for p in points], np.int32)
+    return np.asarray(points, np.int32).reshape(-1, 2)
+
+def pack_points(points):
+    """One int64 key per point of an (n, 2) array, equal keys meaning equal points."""
+    return points[:, 1].astype(np.int64) * (1 << 32) + points[:, 0]
+
+def merge_points(point_sets):
+    if len(point_sets) == 0:
+        return np.empty((0, 2), np.int32)
+    return np.concatenate([points_array(points) for points in point_sets])
+
+class OutputSnapshot:
+    """The algorithm output of a single frame, shared by everything that looks at that frame.
+
+    The points of every detection are read from the algorithm once, when the snapshot is taken,
+    and kept as one NumPy array of all points with offsets, which the evaluator and the visualizers
+    use instead of calling into the algorithm again. The structured array with a record per
+    detection is only built by table(), for the detection report.
+    """
+    def __init__(self, algorithm, output):
+        self.algorithm = algorithm
+        self.output = output
+        self.detections = output.detections
+        self.output_offset = algorithm.get_output_offset()
+        self.detection_table = None
+        # points of all detections in one array, detection i owns rows offsets[i]:offsets[i + 1]
+        point_sets = [points_array(detection.get_points()) for detection in self.detections]
+        self.offsets = np.zeros(len(point_sets) + 1, np.int64)
+        np.cumsum([len(points) for points in point_sets], out=self.offsets[1:])
+        self.all_points = np.concatenate(point_sets) if point_sets else np.empty((0, 2), np.int32)
+        self.points = [self.all_points[self.offsets[i]:self.offsets[i + 1]] for i in range(len(point_sets))]
+        self.smoothed_output = None
+        self.debug_images = {}
+        self.last_debug_image = None
+
+    def table(self):
+        # reading every attribute through the binding is costly, so only the report pays for it
+        if self.detection_table is None:
+            self.detection_table = detections_array(self.detections)
+        return self.detection_table
+
+    def smoothed(self):
+        # the trajectory smoothing used by the demo is only requested when something displays it
+        if self.smoothed_output is None:
+            if self.algorithm is None:
+                return self.output
+            self.smoothed_output = self.algorithm.get_output(True)
+        return self.smoothed_output
+
+    def debug_image(self, level, show_im, show_lm, add):
+        key = (level, show_im, show_lm, add)
+        image = self.debug_images.get(key)
+        if image is None:
+            if self.algorithm is None:
+                # the settings changed after the snapshot was detached, they apply from the next one
+                return self.last_debug_image
+            # copied, the algorithm may reuse its buffer for the next frame while this one is shown
+            image = np.array(self.algorithm.get_debug_image(level, show_im, show_lm, add))
+            self.debug_images[key] = image
+        self.last_debug_image = image
+        return image
+
+    def detach(self):
+        """Stop using the algorithm, which can then go on to the next frame.
+
+        Whatever is wanted from the algorithm besides the points, such as the table, the smoothed
+        output or debug images, has to be requested before. The snapshot can then be used on another
+        thread while the algorithm processes the following frames.
+        """
+        self.algorithm = None
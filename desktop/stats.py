@@ -0,0 +1,118 @@
+import json
+import time
+import tracing
+
+class Stats:
+    DEFAULT_SORT_PERIOD = 1000
+    DEFAULT_WARM_UP = 10
+
+    def __init__(self, sort_period=DEFAULT_SORT_PERIOD, warm_up=DEFAULT_WARM_UP):
+        self.storage_size = 2 * sort_period
+        self.sort_period = sort_period
+        self.warm_up = warm_up
+        self.vec = []
+        self.warm_up_counter = 0
+        self.count = 0
+        self.total = 0
+        self.quantiles = (0, 0, 0)
+
+    def reset(self, def_val):
+        self.vec = []
+        self.warm_up_counter = 0
+        self.count = 0
+        self.total = 0
+        self.quantiles = (def_val, def_val, def_val)
+
+    def add(self, val):
+        self.count += 1
+        self.total += val
+        if self.warm_up_counter < self.warm_up:
+            self.warm_up_counter += 1
+            return False
+        self.vec.append(val)
+        if len(self.vec) % self.sort_period != 0:
+            return False
+        self.update()
+        if len(self.vec) >= self.storage_size:
+            self.vec = self.vec[::2]
+        return True
+
+    def update(self):
+        if not self.vec:
+            return
+        ordered = sorted(self.vec)
+        n = len(ordered)
+        self.quantiles = (ordered[(50 * n) // 100], ordered[(95 * n) // 100], ordered[(99 * n) // 100])
+
+class SectionStats:
+    def __init__(self, sort_period=Stats.DEFAULT_SORT_PERIOD, warm_up=Stats.DEFAULT_WARM_UP):
+        self.stats = Stats(sort_period, warm_up)
+        self.start_ns = 0
+
+    def start(self):
+        self.start_ns = time.perf_counter_ns()
+
+    def stop(self):
+        return self.add(self.start_ns, time.perf_counter_ns())
+
+    def add(self, start_ns, end_ns):
+        return self.stats.add(end_ns - start_ns)
+
+    def quantiles_ms(self):
+        return tuple(q / 1e6 for q in self.stats.quantiles)
+
+def stats_string(stats):
+    q50, q95, q99 = stats.quantiles_ms()
+    return f"{q50:.2f} / {q95:.1f} / {q99:.0f}"
+
+class StageTimes:
+    STAGES = ["decode", "convert", "algorithm", "evaluate", "report", "visualize"]
+    SORT_PERIOD = 30
+    WARM_UP = 5
+
+    def __init__(self, name):
+        self.name = name
+        self.sections = {stage: SectionStats(self.SORT_PERIOD, self.WARM_UP) for stage in self.STAGES}
+
+    def add(self, stage, start_ns, end_ns, frame=None):
+        self.sections[stage].add(start_ns, end_ns)
+        tracing.complete(stage, start_ns, end_ns, frame=frame)
+
+    def timed(self, stage, function):
+        def wrapper(job):
+            start_ns = time.perf_counter_ns()
+            result = function(job)
+            self.add(stage, start_ns, time.perf_counter_ns(), job.in_frame_num)
+            return result
+        return wrapper
+
+    def finish(self):
+        for section in self.sections.values():
+            section.stats.update()
+
+    def lines(self):
+        return [f"{stage}: {stats_string(section)} ms" for stage, section in self.sections.items() if section.stats.count > 0]
+
+    def print(self):
+        print("Stage times (q50 / q95 / q99 ms):")
+        for line in self.lines():
+            print(f"  {line}")
+
+    def to_dict(self):
+        result = {"sequence": self.name, "stages": {}}
+        for stage, section in self.sections.items():
+            if section.stats.count == 0:
+                continue
+            q50, q95, q99 = section.quantiles_ms()
+            result["stages"][stage] = {
+                "count": section.stats.count,
+                "total_ms": section.stats.total / 1e6,
+                "q50_ms": q50,
+                "q95_ms": q95,
+                "q99_ms": q99,
+            }
+        return result
+
+    def save(self, file):
+        with open(file, "a") as f:
+            f.write(json.dumps(self.to_dict()) + "\n")
@@ -0,0 +1,282 @@
+import copy
+import itertools
+import json
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from evaluator import Evaluator, EvalResult, Results, ObjectSet, Event
+from video import VideoInput
+from algorithm import Algorithm
+from snapshot import OutputSnapshot
+
+# command-line name of each algorithm parameter, mapped to its path in the config and its type
+PARAMETERS = {
+    "p-iou-thresh": ("iou_threshold", float),
+    "p-diff-thresh": ("diff.thresh", int),
+    "p-diff-adjust-period": ("diff.adjust_period", int),
+    "p-diff-min-noise": ("diff.noise_min", float),
+    "p-diff-max-noise": ("diff.noise_max", float),
+    "p-max-gap-x": ("max_gap_x", float),
+    "p-min-gap-y": ("min_gap_y", float),
+    "p-max-image-height": ("max_image_height", int),
+    "p-image-height": ("image_height", int),
+    "p-min-strip-height": ("min_strip_height", int),
+    "p-min-strips-in-object": ("min_strips_in_object", int),
+    "p-min-strip-area": ("min_strip_area", float),
+    "p-min-aspect": ("min_aspect", float),
+    "p-min-aspect-for-relevant-angle": ("min_aspect_for_relevant_angle", float),
+    "p-min-dist-to-t-minus-2": ("min_dist_to_t_minus_2", float),
+    "p-match-aspect-max": ("match_aspect_max", float),
+    "p-match-area-max": ("match_area_max", float),
+    "p-match-distance-min": ("match_distance_min", float),
+    "p-match-distance-max": ("match_distance_max", float),
+    "p-match-angle-max": ("match_angle_max", float),
+    "p-match-aspect-weight": ("match_aspect_weight", float),
+    "p-match-area-weight": ("match_area_weight", float),
+    "p-match-distance-weight": ("match_distance_weight", float),
+    "p-match-angle-weight": ("match_angle_weight", float),
+    "p-select-max-distance": ("select_max_distance", float),
+    "p-output-radius-corr": ("output_radius_corr", float),
+    "p-output-radius-min": ("output_radius_min", float),
+    "p-output-raster-corr": ("output_raster_corr", float),
+    "p-output-no-robust-radius": ("output_no_robust_radius", bool),
+    "p-min-strips-in-component": ("min_strips_in_component", int),
+    "p-min-strips-in-cluster": ("min_strips_in_cluster", int),
+    "p-min-cluster-length": ("min_cluster_length", float),
+    "p-weight-height-ratio": ("height_ratio_weight", float),
+    "p-weight-distance": ("distance_weight", float),
+    "p-weight-gaps": ("gaps_weight", float),
+    "p-max-height-ratio-internal": ("max_height_ratio_internal", float),
+    "p-max-height-ratio-external": ("max_height_ratio_external", float),
+    "p-max-distance": ("max_distance", float),
+    "p-max-gaps-length": ("max_gaps_length", float),
+    "p-min-motion": ("min_motion", float),
+}
+
+def make_config(base, values):
+    config = copy.deepcopy(base)
+    for name, value in values.items():
+        path, type = PARAMETERS[name]
+        *parents, attr = path.split(".")
+        target = config
+        for parent in parents:
+            target = getattr(target, parent)
+        setattr(target, attr, type(value))
+    return config
+
+def load_spec(file):
+    """Read a sweep specification and expand it into a list of parameter assignments.
+
+    The file is a JSON object. {"grid": {"p-diff-thresh": [15, 19, 23], ...}} lists the values
+    of each parameter and produces every combination. {"random": {"p-min-aspect": [1.0, 3.0],
+    ...}, "samples": 20, "seed": 0} gives a [low, high] range for each parameter and produces
+    the requested number of uniformly drawn combinations.
+    """
+    with open(file, "r") as f:
+        spec = json.load(f)
+    if "grid" in spec:
+        params = spec["grid"]
+    elif "random" in spec:
+        params = spec["random"]
+    else:
+        raise ValueError("sweep specification must contain 'grid' or 'random'")
+    for name in params:
+        if name not in PARAMETERS:
+            raise ValueError(f"unknown parameter '{name}' in sweep specification")
+
+    if "grid" in spec:
+        names = list(params)
+        return [dict(zip(names, values)) for values in itertools.product(*(params[n] for n in names))]
+
+    rng = random.Random(spec.get("seed", 0))
+    configs = []
+    for _ in range(spec.get("samples", 10)):
+        values = {}
+        for name, (low, high) in params.items():
+            type = PARAMETERS[name][1]
+            if type is float:
+                values[name] = rng.uniform(low, high)
+            else:
+                values[name] = type(rng.randint(int(low), int(high)))
+        configs.append(values)
+    return configs
+
+def format_values(values):
+    return " ".join(f"--{name} {value:.4g}" if isinstance(value, float) else f"--{name} {value}" for name, value in values.items())
+
+def count_events(results):
+    count = {Event.TP: 0, Event.TN: 0, Event.FP: 0, Event.FN: 0}
+    for file in results.list:
+        for frame in file.frames:
+            for event in count:
+                count[event] += frame.get(event, 0)
+    return count
+
+def precision(count):
+    if count[Event.FP] == 0:
+        return 1.0
+    return count[Event.TP] / (count[Event.TP] + count[Event.FP])
+
+def recall(count):
+    if count[Event.FN] == 0:
+        return 1.0
+    return count[Event.TP] / (count[Event.TP] + count[Event.FN])
+
+def fscore(count, beta=1.0):
+    p = precision(count)
+    r = recall(count)
+    if p <= 0 or r <= 0:
+        return 0.0
+    beta_sqr = beta * beta
+    return ((beta_sqr + 1) * p * r) / ((beta_sqr * p) + r)
+
+class Candidate:
+    def __init__(self, values, config):
+        self.values = values
+        self.config = config
+        self.results = Results()
+        self.num_sequences = 0
+        self.algorithm = None
+        self.evaluator = None
+        self.frame_copy = None
+
+    def start(self, format, dims, gt_name, gt):
+        self.algorithm = Algorithm.make(self.config, format, dims)
+        self.evaluator = Evaluator(gt_name, dims, self.results, Results(), gt)
+        self.frame_copy = None
+
+    def process(self, batch):
+        for frame, out_frame_num in batch:
+            # the algorithm takes ownership of its input, so every candidate keeps its own buffer
+            if self.frame_copy is None:
+                self.frame_copy = frame.copy()
+            else:
+                np.copyto(self.frame_copy, frame)
+            self.algorithm.set_input_swap(self.frame_copy)
+            output = OutputSnapshot(self.algorithm, self.algorithm.get_output(False))
+            if out_frame_num >= 1:
+                self.evaluator.evaluate_frame(output, out_frame_num, EvalResult(), self.config.iou_threshold)
+
+    def finish(self):
+        self.num_sequences += 1
+        self.algorithm = None
+        self.evaluator = None
+        self.frame_copy = None
+
+    def count(self):
+        return count_events(self.results)
+
+class Sweep:
+    BATCH_FRAMES = 16
+
+    def __init__(self, args, configs, workers):
+        self.args = args
+        self.candidates = [Candidate(values, make_config(args.params, values)) for values in configs]
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sweep")
+
+    def gt_path(self, input_num):
+        if self.args.gts:
+            return self.args.gts[input_num]
+        return f"{self.args.gt_dir}{self.args.names[input_num]}.txt"
+
+    def run(self, inputs=None, candidates=None):
+        if inputs is None:
+            inputs = range(len(self.args.inputs))
+        if candidates is None:
+            candidates = self.candidates
+        for input_num in inputs:
+            self.run_sequence(input_num, candidates)
+
+    def run_sequence(self, input_num, candidates):
+        input = VideoInput.make_from_file(self.args.inputs[input_num])
+        dims = input.dims()
+        format = "YUV" if self.args.yuv else "BGR"
+        gt_name = self.gt_path(input_num)
+        gt = ObjectSet()
+        gt.load_ground_truth(gt_name, dims)
+        num_gt_frames = gt.num_frames()
+        print(f"Sweeping {self.args.inputs[input_num]} over {len(candidates)} configurations")
+
+        for candidate in candidates:
+            candidate.start(format, dims, gt_name, gt)
+
+        # all candidates run the same algorithm, so they share the output offset
+        in_frame_num = 1
+        out_frame_num = 1 + candidates[0].algorithm.get_output_offset()
+        frame = None
+        batch = []
+        while out_frame_num <= num_gt_frames:
+            if in_frame_num <= num_gt_frames:
+                frame = input.receive_frame()
+                if frame is None:
+                    break
+                if format == "YUV":
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV)
+            batch.append((frame, out_frame_num))
+            if len(batch) == self.BATCH_FRAMES:
+                self.dispatch(candidates, batch)
+                batch = []
+            in_frame_num += 1
+            out_frame_num += 1
+        if batch:
+            self.dispatch(candidates, batch)
+
+        for candidate in candidates:
+            candidate.finish()
+
+    def race(self, eta, start):
+        """Successive halving: run all candidates on the first `start` sequences, keep the best
+        1/eta of them by F-score and run the survivors on eta times as many sequences, until
+        the survivors have seen the whole dataset or a single candidate is left."""
+        num_inputs = len(self.args.inputs)
+        survivors = self.candidates
+        done = 0
+        budget = min(start, num_inputs)
+        while True:
+            self.run(range(done, budget), survivors)
+            done = budget
+            if done == num_inputs or len(survivors) == 1:
+                return survivors
+            keep = max(1, len(survivors) // eta)
+            survivors = self.ranked(survivors)[:keep]
+            print(f"Race: {keep} configurations advance after {done} sequences")
+            budget = min(budget * eta, num_inputs)
+
+    def dispatch(self, candidates, batch):
+        # each candidate processes the whole batch in order on a single worker, the decoded
+        # frames are shared between candidates and only read
+        for future in [self.executor.submit(candidate.process, batch) for candidate in candidates]:
+            future.result()
+
+    def ranked(self, candidates=None):
+        if candidates is None:
+            candidates = self.candidates
+        # candidates dropped early by a race rank below the ones that were evaluated further
+        return sorted(candidates, key=lambda c: (c.num_sequences, fscore(c.count())), reverse=True)
+
+    def write(self, out, candidates=None):
+        out.write("rank|seqs|F_1.0  |precision|recall |parameters\n")
+        out.write("----|----|-------|---------|-------|----------\n")
+        for rank, candidate in enumerate(self.ranked(candidates), 1):
+            count = candidate.count()
+            out.write(f"{rank:<4}|{candidate.num_sequences:<4}|{fscore(count) * 100:6.2f}%|{precision(count) * 100:8.2f}%|{recall(count) * 100:6.2f}%|{format_values(candidate.values)}\n")
+
+    def close(self):
+        self.executor.shutdown()
+
+def run_sweep(args):
+    configs = load_spec(args.sweep)
+    if not configs:
+        raise ValueError("sweep specification produced no configurations")
+    sweep = Sweep(args, configs, args.sweep_workers)
+    try:
+        if args.sweep_race:
+            sweep.race(args.sweep_race, args.sweep_race_start)
+        else:
+            sweep.run()
+        sweep.write(sys.stdout)
+    finally:
+        sweep.close()
+    return sweep
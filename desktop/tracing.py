@@ -0,0 +1,92 @@
+import json
+import os
+import queue
+import threading
+import time
+
+class ThreadBuffer:
+    def __init__(self, thread):
+        self.tid = thread.ident
+        self.name = thread.name
+        self.events = []
+
+class TraceRecorder:
+    FLUSH_EVENTS = 4096
+
+    def __init__(self, filename):
+        self.file = open(filename, "w")
+        self.file.write("[\n")
+        self.first = True
+        self.pid = os.getpid()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.buffers = []
+        self.pending = queue.Queue()
+        self.writer = threading.Thread(target=self.writer_impl, name="trace-writer")
+        self.writer.start()
+
+    def buffer(self):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            buffer = ThreadBuffer(threading.current_thread())
+            self.local.buffer = buffer
+            with self.lock:
+                self.buffers.append(buffer)
+        return buffer
+
+    def complete(self, name, start_ns, end_ns, args):
+        buffer = self.buffer()
+        buffer.events.append((name, start_ns, end_ns, args))
+        if len(buffer.events) >= self.FLUSH_EVENTS:
+            self.pending.put((buffer.tid, buffer.events))
+            buffer.events = []
+
+    def writer_impl(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            tid, events = item
+            for name, start_ns, end_ns, args in events:
+                event = {"name": name, "ph": "X", "ts": start_ns / 1e3, "dur": (end_ns - start_ns) / 1e3, "pid": self.pid, "tid": tid}
+                if args:
+                    event["args"] = args
+                self.write(event)
+
+    def write(self, event):
+        if not self.first:
+            self.file.write(",\n")
+        self.first = False
+        self.file.write(json.dumps(event))
+
+    def close(self):
+        with self.lock:
+            buffers = list(self.buffers)
+        for buffer in buffers:
+            self.pending.put((buffer.tid, buffer.events))
+            buffer.events = []
+        self.pending.put(None)
+        self.writer.join()
+        for buffer in buffers:
+            self.write({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": buffer.tid, "args": {"name": buffer.name}})
+        self.file.write("\n]\n")
+        self.file.close()
+
+current = None
+
+def start(filename):
+    global current
+    current = TraceRecorder(filename)
+
+def stop():
+    global current
+    if current is not None:
+        current.close()
+        current = None
+
+def now():
+    return time.perf_counter_ns()
+
+def complete(name, start_ns, end_ns, **args):
+    if current is not None:
+        current.complete(name, start_ns, end_ns, args)
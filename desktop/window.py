@@ -2,7 +2,9 @@ import cv2
 import numpy as np
 import time
 import threading
-from collections import deque
+from collections import deque, OrderedDict
+from functools import lru_cache
+from snapshot import points_array, pack_points
 
 class Colour:
     def __init__(self, b, g, r):
@@ -50,6 +52,60 @@ class Colour:
     def lightGray():
         return Colour(0xC0, 0xC0, 0xC0)
 
+FONT_FACE = cv2.FONT_HERSHEY_SIMPLEX
+SPRITE_CACHE_SIZE = 256
+
+@lru_cache(maxsize=1024)
+def textSize(text, fontScale, thick):
+    return cv2.getTextSize(text, FONT_FACE, fontScale, thick)
+
+def darken(region):
+    # the overlay background keeps 30 % of the image below it; scaled in place, without the
+    # float64 temporaries of numpy arithmetic
+    cv2.convertScaleAbs(region, dst=region, alpha=0.3)
+
+class TextSprite:
+    """A line of text rendered once into a BGRA image, to be blended over frames in place.
+
+    cv2.putText antialiases the text against the transparent black of the sprite, so the colour
+    channels come out premultiplied by the coverage in the alpha channel. Blending is then the
+    8-bit "over" operation, out = bgr + image * (255 - a) / 255, done by OpenCV on the pixels
+    under the text only.
+    """
+    def __init__(self, parts, clr, fontScale, thick):
+        # glyphs of the Hershey fonts reach a little beyond the size reported for them
+        margin = 2 * thick + 2
+        sizes = [textSize(text, fontScale, thick) for _, text in parts]
+        width = max(x + size[0][0] for (x, _), size in zip(parts, sizes))
+        height = max(size[0][1] for size in sizes)
+        baseline = max(size[1] for size in sizes)
+        bgra = np.zeros((height + baseline + 2 * margin, width + 2 * margin, 4), np.uint8)
+        for x, text in parts:
+            cv2.putText(bgra, text, (margin + x, margin + height), FONT_FACE, fontScale, clr + (255,), thick)
+
+        # keep only the bounding box of what was drawn
+        x, y, w, h = cv2.boundingRect(bgra[:, :, 3])
+        self.bgra = bgra[y:y + h, x:x + w].copy()
+        self.origin = (margin - x, margin + height - y)
+        self.colour = np.ascontiguousarray(self.bgra[:, :, :3])
+        self.inverse = np.repeat(255 - self.bgra[:, :, 3:], 3, axis=2)
+
+    def blend(self, mat, x, y):
+        """Blend the sprite with the text baseline starting at x, y, as cv2.putText would draw it.
+        Returns the rectangle (x0, y0, x1, y1) of mat that was drawn over, or None."""
+        x -= self.origin[0]
+        y -= self.origin[1]
+        h, w = self.bgra.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, mat.shape[1]), min(y + h, mat.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return None
+        region = mat[y0:y1, x0:x1]
+        sprite = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+        cv2.multiply(region, self.inverse[sprite], dst=region, scale=1 / 255)
+        cv2.add(region, self.colour[sprite], dst=region)
+        return (x0, y0, x1, y1)
+
 class Window:
     def __init__(self):
         self.mFrameNs = 0
@@ -64,6 +120,8 @@ class Window:
         self.mCenterUnderLine = ""
         self.mTable = []
         self.visTable = False
+        self.mSprites = OrderedDict()
+        self.preview = None
 
     def close(self):
         if not self.mOpen:
@@ -89,11 +147,16 @@ class Window:
         self.mTopLine = text
 
     def display(self, image):
+        """Show the image with the text drawn over it in place. Returns the rectangles of the image
+        that the text was drawn over, as printText does."""
         self.open(image.shape[:2])
         mat = image
-        self.printText(mat)
+        drawn = self.printText(mat)
+        if self.preview and self.preview.has_clients():
+            self.preview.publish(mat.copy())
         cv2.imshow("FMO", mat)
         cv2.setWindowProperty("FMO", cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+        return drawn
 
     def setFrameTime(self, sec):
         self.mFrameNs = int(1e9 * sec)
@@ -162,27 +225,44 @@ class Window:
         }
         return key_map.get(keyCode, "NONE")
 
+    def sprite(self, parts, clr, fontScale, thick):
+        """The text sprite of one line made of (x, text) parts, rendered on first use and kept
+        until it falls out of the cache."""
+        key = (parts, clr, fontScale, thick)
+        sprite = self.mSprites.get(key)
+        if sprite is None:
+            sprite = TextSprite(parts, clr, fontScale, thick)
+            if len(self.mSprites) >= SPRITE_CACHE_SIZE:
+                self.mSprites.popitem(last=False)
+            self.mSprites[key] = sprite
+        else:
+            self.mSprites.move_to_end(key)
+        return sprite
+
     def printText(self, mat):
-        fontFace = cv2.FONT_HERSHEY_SIMPLEX
+        """Draw the text lines over mat in place and return the rectangles (x0, y0, x1, y1) that
+        were drawn over."""
+        drawn = []
         fontScale = mat.shape[0] / 1000.0
         thick = 2 if mat.shape[0] > 800 else 1
         pad = int(fontScale * 10)
         color = (self.mColour.b, self.mColour.g, self.mColour.r)
 
-        lineHeight = cv2.getTextSize("ABC", fontFace, fontScale, thick)[0][1]
+        lineHeight = textSize("ABC", fontScale, thick)[0][1]
         above = (9 * lineHeight // 14) + (lineHeight // 2)
         below = 5 * lineHeight // 14
 
         if self.mLines:
-            lineWidth = max(cv2.getTextSize(line, fontFace, fontScale, thick)[0][0] for line in self.mLines)
+            lineWidth = max(textSize(line, fontScale, thick)[0][0] for line in self.mLines)
             xMax = 2 * pad + lineWidth
             yMax = 2 * pad + len(self.mLines) * (above + below)
-            mat[:yMax, :xMax] = (0.3 * mat[:yMax, :xMax]).astype(np.uint8)
+            darken(mat[:yMax, :xMax])
+            drawn.append((0, 0, xMax, yMax))
 
             y = pad
             for line, clr in zip(self.mLines, self.mLineClrs):
                 y += above
-                cv2.putText(mat, line, (pad, y), fontFace, fontScale, (clr.b, clr.g, clr.r), thick)
+                drawn.append(self.sprite(((0, line),), (clr.b, clr.g, clr.r), fontScale, thick).blend(mat, pad, y))
                 y += below
 
             self.mLines.clear()
@@ -190,70 +270,71 @@ class Window:
 
         if self.mBottomLine:
             helpRectHeight = (above + below) + 2 * pad
-            mat[-helpRectHeight:, :] = (0.3 * mat[-helpRectHeight:, :]).astype(np.uint8)
-            cv2.putText(mat, self.mBottomLine, (pad, mat.shape[0] - pad - below), fontFace, fontScale, color, thick)
+            darken(mat[-helpRectHeight:, :])
+            drawn.append((0, mat.shape[0] - helpRectHeight, mat.shape[1], mat.shape[0]))
+            drawn.append(self.sprite(((0, self.mBottomLine),), color, fontScale, thick).blend(mat, pad, mat.shape[0] - pad - below))
 
         if self.mTopLine:
-            lineSize = cv2.getTextSize(self.mTopLine, fontFace, fontScale, thick)[0]
+            lineSize = textSize(self.mTopLine, fontScale, thick)[0]
             helpRectHeight = (above + below) + 2 * pad
             lineWidth = lineSize[0] + 2 * pad
             offset = (mat.shape[1] - lineWidth) // 2
-            mat[:helpRectHeight, offset:offset + lineWidth] = (0.3 * mat[:helpRectHeight, offset:offset + lineWidth]).astype(np.uint8)
-            cv2.putText(mat, self.mTopLine, (pad + offset, above + pad // 2), fontFace, fontScale, color, thick)
+            darken(mat[:helpRectHeight, offset:offset + lineWidth])
+            drawn.append((offset, 0, offset + lineWidth, helpRectHeight))
+            drawn.append(self.sprite(((0, self.mTopLine),), color, fontScale, thick).blend(mat, pad + offset, above + pad // 2))
 
         if self.mCenterLine or self.mCenterUnderLine:
             fontScaleCenter = 3 * fontScale
             thickCenter = 3 * thick
-            lineSize = cv2.getTextSize(self.mCenterLine, fontFace, fontScaleCenter, thickCenter)[0]
+            lineSize = textSize(self.mCenterLine, fontScaleCenter, thickCenter)[0]
             lineWidth = lineSize[0] + 2 * pad
             lineHeight = lineSize[1] + 2 * pad
             offsetW = (mat.shape[1] - lineWidth) // 2 + 4 * pad
             offsetH = (mat.shape[0] - lineHeight) // 2 + 2 * lineHeight
             mat[offsetH:offsetH + lineHeight, offsetW:offsetW + lineWidth] = 0
-            cv2.putText(mat, self.mCenterLine, (offsetW + pad, offsetH - 2 * pad), fontFace, fontScaleCenter, color, thickCenter)
-            cv2.putText(mat, self.mCenterUnderLine, (offsetW + pad, offsetH + lineHeight - 2 * pad), fontFace, fontScaleCenter, color, thickCenter)
+            drawn.append((offsetW, offsetH, offsetW + lineWidth, offsetH + lineHeight))
+            drawn.append(self.sprite(((0, self.mCenterLine),), color, fontScaleCenter, thickCenter).blend(mat, offsetW + pad, offsetH - 2 * pad))
+            drawn.append(self.sprite(((0, self.mCenterUnderLine),), color, fontScaleCenter, thickCenter).blend(mat, offsetW + pad, offsetH + lineHeight - 2 * pad))
 
         if self.visTable and self.mTable:
-            lineSize1 = cv2.getTextSize("10. ", fontFace, fontScale, thick)[0]
-            lineSize2 = cv2.getTextSize("wwwwwwwwww  ", fontFace, fontScale, thick)[0]
-            lineSize3 = cv2.getTextSize("444.44", fontFace, fontScale, thick)[0]
+            lineSize1 = textSize("10. ", fontScale, thick)[0]
+            lineSize2 = textSize("wwwwwwwwww  ", fontScale, thick)[0]
+            lineSize3 = textSize("444.44", fontScale, thick)[0]
             lineWidth = lineSize1[0] + lineSize2[0] + lineSize3[0]
 
             xMax = pad + lineWidth
             yMax = 2 * pad + len(self.mTable) * (above + below)
-            mat[:yMax, :xMax] = (0.3 * mat[:yMax, :xMax]).astype(np.uint8)
+            darken(mat[:yMax, :xMax])
+            drawn.append((0, 0, xMax, yMax))
 
             y = pad
             for i, (score, name) in enumerate(self.mTable):
                 pref = " " if i < 9 else ""
                 y += above
-                cv2.putText(mat, f"{pref}{i + 1}.", (pad, y), fontFace, fontScale, color, thick)
-                cv2.putText(mat, name, (lineSize1[0] + pad, y), fontFace, fontScale, color, thick)
-                cv2.putText(mat, f"{score:.2f}", (lineSize1[0] + lineSize2[0] + pad, y), fontFace, fontScale, color, thick)
+                parts = ((0, f"{pref}{i + 1}."), (lineSize1[0], name), (lineSize1[0] + lineSize2[0], f"{score:.2f}"))
+                drawn.append(self.sprite(parts, color, fontScale, thick).blend(mat, pad, y))
                 y += below
 
+        return [rect for rect in drawn if rect is not None]
+
 def drawPoints(points, target, colour):
-    mat = target
-    vec = (colour.b, colour.g, colour.r)
-    for pt in points:
-        mat[pt[1], pt[0]] = vec
+    pts = points_array(points)
+    target[pts[:, 1], pts[:, 0]] = (colour.b, colour.g, colour.r)
 
 def drawPointsGt(ps, gt, target):
-    mat = target
     c1 = (Colour.lightMagenta().b, Colour.lightMagenta().g, Colour.lightMagenta().r)
     c2 = (Colour.lightRed().b, Colour.lightRed().g, Colour.lightRed().r)
     c3 = (Colour.lightGreen().b, Colour.lightGreen().g, Colour.lightGreen().r)
-    for pt in ps:
-        if pt in gt:
-            mat[pt[1], pt[0]] = c3
-        else:
-            mat[pt[1], pt[0]] = c1
-    for pt in gt:
-        if pt not in ps:
-            mat[pt[1], pt[0]] = c2
+    ps = points_array(ps)
+    gt = points_array(gt)
+    psKeys = pack_points(ps)
+    gtKeys = pack_points(gt)
+    hit = np.isin(psKeys, gtKeys)
+    missed = ~np.isin(gtKeys, psKeys)
+    target[ps[hit, 1], ps[hit, 0]] = c3
+    target[ps[~hit, 1], ps[~hit, 0]] = c1
+    target[gt[missed, 1], gt[missed, 0]] = c2
 
 def removePoints(points, target, bg):
-    mat = target
-    b = bg
-    for pt in points:
-        mat[pt[1], pt[0]] = b[pt[1], pt[0]]
+    pts = points_array(points)
+    target[pts[:, 1], pts[:, 0]] = bg[pts[:, 1], pts[:, 0]]